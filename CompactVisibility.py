@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+import binascii
+
+
+class CompactVisibility:
+    """
+    Компактное хранилище видимостей клеток: по биту на пару клеток и стойку вместо байта
+
+    Видимость через min(viewer_stance, object_stance) симметрична, поэтому храним только нижний треугольник
+    (object <= viewer в порядке x * height + y). Строки заполняются по одной прямо из потока протокола,
+    полная матрица в памяти не нужна. Для запросов "кто видит клетку" строка разворачивается в целое-битсет
+    (бит i - клетка с индексом i), так что пересечение условий делается одним побитовым AND.
+
+    """
+
+    ROW_CACHE_SIZE = 256
+
+    BIT_CHARS = "".join("1" if byte == 1 else "0" for byte in xrange(256))
+
+    def __init__(self, width, height, stance_count):
+        self.width = width
+        self.height = height
+        self.stance_count = stance_count
+        self.cell_count = width * height
+
+        triangle_bit_count = self.cell_count * (self.cell_count + 1) / 2
+        self.triangles = [bytearray((triangle_bit_count + 7) / 8) for stance in xrange(stance_count)]
+
+        self.rows = {}
+        self.range_masks = {}
+
+    def add_row(self, cell_index, row):
+        """
+        Принимаем строку исходного тензора для клетки-наблюдателя: cell_count * stance_count байт
+        Строки должны приходить по порядку индексов клеток, как в протоколе
+
+        """
+
+        bit_chars = str(row).translate(CompactVisibility.BIT_CHARS)
+        bit_offset = cell_index * (cell_index + 1) / 2
+        shift = bit_offset & 7
+        start = bit_offset >> 3
+        byte_count = (shift + cell_index + 8) >> 3
+
+        for stance in xrange(self.stance_count):
+            value = int(bit_chars[stance::self.stance_count][:cell_index + 1][::-1], 2) << shift
+            raw = binascii.unhexlify("%0*x" % (byte_count * 2, value))[::-1]
+
+            triangle = self.triangles[stance]
+            triangle[start] |= ord(raw[0])
+            triangle[start + 1:start + byte_count] = raw[1:]
+
+    def index(self, x, y):
+        return x * self.height + y
+
+    def coord(self, index):
+        return index / self.height, index % self.height
+
+    def _bit(self, stance, viewer_index, object_index):
+        if object_index > viewer_index:
+            viewer_index, object_index = object_index, viewer_index
+
+        bit_index = viewer_index * (viewer_index + 1) / 2 + object_index
+        return (self.triangles[stance][bit_index >> 3] >> (bit_index & 7)) & 1
+
+    def is_visible(self, max_range,
+                   viewer_x, viewer_y, viewer_stance,
+                   object_x, object_y, object_stance):
+        x_range = object_x - viewer_x
+        y_range = object_y - viewer_y
+
+        return x_range * x_range + y_range * y_range <= max_range * max_range and self._bit(
+            min(viewer_stance, object_stance), viewer_x * self.height + viewer_y, object_x * self.height + object_y
+        ) == 1
+
+    def row(self, x, y, stance):
+        """
+        Битсет клеток, которые видны из (x, y) при стойке stance (и, в силу симметрии, видят её)
+
+        """
+
+        key = (x * self.height + y, stance)
+        bits = self.rows.get(key)
+        if bits is not None:
+            return bits
+
+        cell_index = key[0]
+        bit_offset = cell_index * (cell_index + 1) / 2
+        shift = bit_offset & 7
+        start = bit_offset >> 3
+        byte_count = (shift + cell_index + 8) >> 3
+
+        triangle = self.triangles[stance]
+        bits = (int(binascii.hexlify(str(triangle[start:start + byte_count])[::-1]), 16) >> shift) & \
+            ((1 << (cell_index + 1)) - 1)
+
+        # остаток строки - столбец cell_index в строках треугольника ниже
+        bit_index = (cell_index + 1) * (cell_index + 2) / 2 + cell_index
+        for object_index in xrange(cell_index + 1, self.cell_count):
+            if (triangle[bit_index >> 3] >> (bit_index & 7)) & 1:
+                bits |= 1 << object_index
+            bit_index += object_index + 1
+
+        if len(self.rows) >= CompactVisibility.ROW_CACHE_SIZE:
+            self.rows.clear()
+        self.rows[key] = bits
+
+        return bits
+
+    def range_mask(self, x, y, max_range):
+        key = (x, y, max_range)
+        bits = self.range_masks.get(key)
+
+        if bits is None:
+            bits = 0
+            max_range_square = max_range * max_range
+            for object_x in xrange(max(0, int(x - max_range)), min(self.width, int(x + max_range) + 1)):
+                for object_y in xrange(max(0, int(y - max_range)), min(self.height, int(y + max_range) + 1)):
+                    if (object_x - x) * (object_x - x) + (object_y - y) * (object_y - y) <= max_range_square:
+                        bits |= 1 << (object_x * self.height + object_y)
+
+            if len(self.range_masks) >= CompactVisibility.ROW_CACHE_SIZE:
+                self.range_masks.clear()
+            self.range_masks[key] = bits
+
+        return bits
+
+    def visible_cells_bits(self, max_range, viewer_x, viewer_y, viewer_stance, object_stance):
+        return self.row(viewer_x, viewer_y, min(viewer_stance, object_stance)) & \
+            self.range_mask(viewer_x, viewer_y, max_range)
+
+    def coords(self, bits):
+        out = []
+
+        while bits:
+            lowest_bit = bits & -bits
+            out.append(self.coord(lowest_bit.bit_length() - 1))
+            bits ^= lowest_bit
+
+        return out
+
+    def size_bytes(self):
+        return sum(len(triangle) for triangle in self.triangles)
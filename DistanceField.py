@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import random
+from array import array
+from collections import deque
+
+import SharedVars as shared
+from PassabilityGrid import passability_grid_for
+
+
+class DistanceField:
+    """
+    Поле расстояний до цели по статической карте: обратный BFS от цели один раз, дальше путь до неё
+    из любой клетки - спуск по полю, по соседям с расстоянием на единицу меньше (O(длины пути))
+
+    Бойцы на поле не наносятся. Если на спуске все подходящие соседи перекрыты картой проходимости
+    запроса, descend отдаёт None и путь ищется обычным поиском; само поле при этом остаётся верным.
+
+    """
+
+    def __init__(self, grid, target):
+        self.grid = grid
+        self.target = target
+        self.distances = array("i", [-1]) * grid.cell_count
+
+        if not grid.passable[target]:
+            return
+
+        neighbours = grid.neighbours
+        passable = grid.passable
+        distances = self.distances
+
+        distances[target] = 0
+        queue = deque([target])
+
+        while queue:
+            cell = queue.popleft()
+            distance = distances[cell] + 1
+
+            for i in neighbours[cell]:
+                if passable[i] and distances[i] < 0:
+                    distances[i] = distance
+                    queue.append(i)
+
+    def distance(self, cell):
+        """
+        Длина кратчайшего пути до цели по статической карте, -1 - если цель недостижима
+
+        """
+
+        return self.distances[cell]
+
+    def descend(self, passable, start, shuffle=random.shuffle):
+        """
+        Путь индексами клеток от start (не включая) до цели (включая) по клеткам, проходимым в passable
+        None - если цель недостижима или спуск перекрыт
+
+        """
+
+        distances = self.distances
+        neighbours = self.grid.neighbours
+
+        if distances[start] < 0:
+            return None
+
+        path = []
+        current_cell = start
+
+        while current_cell != self.target:
+            cells = [i for i in neighbours[current_cell] if passable[i] and distances[i] == distances[current_cell] - 1]
+            if not cells:
+                return None
+
+            shuffle(cells)
+            current_cell = cells.pop()
+            path.append(current_cell)
+
+        return path
+
+
+class DistanceFields:
+    """
+    Общий для команды кеш полей расстояний по клеткам-целям (вейпоинты, бойцы, бонусы) на одну карту
+
+    """
+
+    CACHE_SIZE = 64
+
+    def __init__(self, grid):
+        self.grid = grid
+        self.fields = {}
+
+    def field(self, target):
+        field = self.fields.get(target)
+
+        if field is None:
+            if len(self.fields) >= DistanceFields.CACHE_SIZE:
+                self.fields.clear()
+            field = self.fields[target] = DistanceField(self.grid, target)
+
+        return field
+
+    def cached_field(self, target):
+        return self.fields.get(target)
+
+
+def distance_fields_for(world):
+    grid = passability_grid_for(world)
+
+    if shared.distance_fields is None or shared.distance_fields.grid is not grid:
+        shared.distance_fields = DistanceFields(grid)
+
+    return shared.distance_fields
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+from math import sqrt
+
+from WorldIndex import world_index_for
+
+
+class Engagement:
+    """
+    Огневой контакт своих бойцов с видимыми врагами на снимок мира
+
+    Каждая проверка - прямой вызов world.is_visible, без предрасчёта: матрица по всем парам (одна выборка numpy
+    из тензора видимостей) на размерах этой игры (до 5 x 15 пар) не окупалась ни разу. Списки врагов
+    по хитам и по удалённости от центра отряда сортируются при обращении.
+
+    """
+
+    def __init__(self, world):
+        index = world_index_for(world)
+
+        self.world = world
+        self.teammates = index.teammates
+        self.enemies = index.enemies
+        self.team_coord = index.team_coord
+
+    @property
+    def enemies_by_hitpoints(self):
+        return sorted(self.enemies, key=lambda e: e.hitpoints)
+
+    @property
+    def enemies_by_team_distance(self):
+        if self.team_coord is None:
+            return list(self.enemies)
+
+        team_coord = self.team_coord
+        return sorted(self.enemies, key=lambda e: (e.x - team_coord[0]) ** 2 + (e.y - team_coord[1]) ** 2)
+
+    def visible(self, trooper, enemy, stance):
+        """
+        Только линия видимости, без дальности
+
+        """
+
+        return self.world.is_visible(self.world.width + self.world.height, trooper.x, trooper.y, stance,
+                                     enemy.x, enemy.y, enemy.stance)
+
+    def distance(self, trooper, enemy):
+        return sqrt((enemy.x - trooper.x) ** 2 + (enemy.y - trooper.y) ** 2)
+
+    def in_range(self, trooper, enemy, max_range=None):
+        """
+        Достаёт ли враг: по дальности стрельбы бойца или по своей дальности max_range (например, броска гранаты)
+
+        """
+
+        if max_range is None:
+            max_range = trooper.shooting_range
+
+        return (enemy.x - trooper.x) ** 2 + (enemy.y - trooper.y) ** 2 <= max_range * max_range
+
+    def can_shoot(self, trooper, enemy, stance):
+        return self.world.is_visible(trooper.shooting_range, trooper.x, trooper.y, stance,
+                                     enemy.x, enemy.y, enemy.stance)
+
+    def shots_to_kill_count(self, trooper, enemy, stance):
+        return -(-enemy.hitpoints // max(trooper.get_damage(stance), 1))
+
+    def shootable_enemies(self, trooper, stance=None):
+        """
+        Враги, которых боец достаёт из оружия (в своей стойке или в stance), по возрастанию хитов
+
+        """
+
+        if stance is None:
+            stance = trooper.stance
+
+        return [e for e in self.enemies_by_hitpoints if self.can_shoot(trooper, e, stance)]
+
+
+def engagement_for(world):
+    engagement = getattr(world, "engagement", None)
+
+    if engagement is None:
+        engagement = world.engagement = Engagement(world)
+
+    return engagement
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+from WorldIndex import world_index_for
+
+from model.TrooperStance import TrooperStance
+
+
+class GrenadePlanner:
+    """
+    Выбор клетки для броска гранаты: оценка клеток один раз на снимок мира
+
+    Граната бьёт по бойцу в клетке попадания (grenade_direct_damage) и по бойцам в четырёх соседних
+    (grenade_collateral_damage). Оценка клетки - суммарный урон врагам (не больше их хитов); клетки, где заденем
+    своих (и себя), выкидываются. Ненулевая оценка бывает только у клеток врагов и их соседей, поэтому урон
+    накапливается в словаре по этим клеткам, без сетки на всю карту и без numpy (плотная свёртка numpy
+    по всей карте выходила медленнее). Для конкретного бойца остаётся отобрать видимые клетки в радиусе броска
+    и взять лучшую.
+
+    """
+
+    def __init__(self, world, game):
+        index = world_index_for(world)
+
+        self.width = world.width
+        self.height = world.height
+
+        scores = {}
+        for enemy in index.enemies:
+            direct_damage = min(game.grenade_direct_damage, enemy.hitpoints)
+            collateral_damage = min(game.grenade_collateral_damage, enemy.hitpoints)
+
+            scores[(enemy.x, enemy.y)] = scores.get((enemy.x, enemy.y), 0) + direct_damage
+            for coord in self._cross(enemy.x, enemy.y):
+                scores[coord] = scores.get(coord, 0) + collateral_damage
+
+        for t in index.teammates:
+            for coord in self.damage_cells(t.x, t.y):
+                scores.pop(coord, None)
+
+        # при равном уроне - клетка с меньшим индексом
+        self.targets = sorted(((damage, -(x * self.height + y), x, y) for (x, y), damage in scores.iteritems()),
+                              reverse=True)
+
+    def _cross(self, x, y):
+        return [(cx, cy) for cx, cy in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1))
+                if 0 <= cx < self.width and 0 <= cy < self.height]
+
+    def damage_cells(self, x, y):
+        """
+        Клетки, по которым бьёт граната, брошенная в (x, y): сама клетка (прямой урон) и крест вокруг неё
+
+        """
+
+        return [(x, y)] + self._cross(x, y)
+
+    def best_target(self, me, world, game):
+        """
+        Лучшая клетка для броска гранаты бойцом me и урон по врагам, (x, y, damage); None - если бросать некуда
+
+        """
+
+        for damage, order, x, y in self.targets:
+            if world.is_visible(game.grenade_throw_range, me.x, me.y, me.stance, x, y, TrooperStance.STANDING):
+                return x, y, damage
+
+        return None
+
+
+def grenade_planner_for(world, game):
+    planner = getattr(world, "grenade_planner", None)
+
+    if planner is None:
+        planner = world.grenade_planner = GrenadePlanner(world, game)
+
+    return planner
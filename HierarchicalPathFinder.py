@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+from array import array
+from collections import deque
+
+import SharedVars as shared
+from PassabilityGrid import passability_grid_for
+
+
+class HierarchicalPathFinder:
+    """
+    Иерархический поиск пути (HPA*) для больших карт
+
+    Карта режется на квадратные кластеры. На границах соседних кластеров ищутся входы: отрезки клеток, проходимых
+    с обеих сторон. Короткий вход даёт один переход посередине, длинный - два, по краям. Клетки переходов -
+    вершины абстрактного графа. Рёбра внутри кластера (BFS по кластеру) считаются лениво, при первом заходе поиска
+    в кластер, и запоминаются на всю игру.
+    Запрос: старт и финиш подключаются к входам своих кластеров, A* идёт по абстрактному графу, потом
+    уточняются только отрезки найденного пути (BFS внутри одного кластера). Путь близок к кратчайшему,
+    но не обязательно кратчайший. Время запроса растёт с длиной пути, а не с площадью карты.
+
+    """
+
+    CLUSTER_SIZE = 10
+    LONG_ENTRANCE_SIZE = 6
+
+    def __init__(self, grid, cluster_size=CLUSTER_SIZE):
+        self.grid = grid
+        self.cluster_size = cluster_size
+        self.cluster_height = (grid.height + cluster_size - 1) / cluster_size
+        cluster_count = ((grid.width + cluster_size - 1) / cluster_size) * self.cluster_height
+
+        self.cell_clusters = array("i", [(x / cluster_size) * self.cluster_height + y / cluster_size
+                                         for x in xrange(grid.width) for y in xrange(grid.height)])
+
+        self.entrances = [[] for cluster in xrange(cluster_count)]
+        self.transitions = {}
+        self.intra_edges = {}
+
+        self._build_entrances()
+
+    def _build_entrances(self):
+        grid = self.grid
+        size = self.cluster_size
+
+        # вертикальные границы: между столбцами x и x + 1
+        for x in xrange(size - 1, grid.width - 1, size):
+            for y_start in xrange(0, grid.height, size):
+                self._add_entrances([(grid.index(x, y), grid.index(x + 1, y))
+                                     for y in xrange(y_start, min(y_start + size, grid.height))])
+
+        # горизонтальные границы: между строками y и y + 1
+        for y in xrange(size - 1, grid.height - 1, size):
+            for x_start in xrange(0, grid.width, size):
+                self._add_entrances([(grid.index(x, y), grid.index(x, y + 1))
+                                     for x in xrange(x_start, min(x_start + size, grid.width))])
+
+    def _add_entrances(self, border):
+        passable = self.grid.passable
+        entrance = []
+
+        for pair in border + [None]:
+            if pair is not None and passable[pair[0]] and passable[pair[1]]:
+                entrance.append(pair)
+                continue
+
+            if entrance:
+                if len(entrance) < HierarchicalPathFinder.LONG_ENTRANCE_SIZE:
+                    pairs = [entrance[len(entrance) / 2]]
+                else:
+                    pairs = [entrance[0], entrance[-1]]
+
+                for a, b in pairs:
+                    self._add_transition(a, b)
+                    self._add_transition(b, a)
+
+                entrance = []
+
+    def _add_transition(self, cell, other_cell):
+        if cell not in self.transitions:
+            self.transitions[cell] = []
+            self.entrances[self.cell_clusters[cell]].append(cell)
+
+        self.transitions[cell].append(other_cell)
+
+    def _cluster_search(self, passable, source, target=None):
+        """
+        BFS от source, не выходя из его кластера; отдаём расстояния и родителей клеток
+
+        """
+
+        cluster = self.cell_clusters[source]
+        cell_clusters = self.cell_clusters
+        neighbours = self.grid.neighbours
+
+        distances = {source: 0}
+        parents = {}
+        queue = deque([source])
+
+        while queue:
+            cell = queue.popleft()
+            if cell == target:
+                break
+
+            distance = distances[cell] + 1
+            for i in neighbours[cell]:
+                if passable[i] and i not in distances and cell_clusters[i] == cluster:
+                    distances[i] = distance
+                    parents[i] = cell
+                    queue.append(i)
+
+        return distances, parents
+
+    def _cluster_edges(self, cluster):
+        edges = self.intra_edges.get(cluster)
+
+        if edges is None:
+            edges = self.intra_edges[cluster] = {}
+            entrances = self.entrances[cluster]
+
+            for entrance in entrances:
+                distances, parents = self._cluster_search(self.grid.passable, entrance)
+                edges[entrance] = [(other, distances[other]) for other in entrances
+                                   if other != entrance and other in distances]
+
+        return edges
+
+    def find_path(self, passable, start, finish):
+        """
+        Путь индексами клеток от start (не включая) до finish (включая), None - если путь не найден
+
+        """
+
+        if not passable[finish]:
+            return None
+
+        cell_clusters = self.cell_clusters
+        finish_cluster = cell_clusters[finish]
+
+        # в сетке с 4-связностью расстояния симметричны: BFS от финиша даёт расстояния от входов до него
+        finish_distances, parents = self._cluster_search(passable, finish)
+        finish_edges = dict((entrance, finish_distances[entrance]) for entrance in self.entrances[finish_cluster]
+                            if entrance != finish and entrance in finish_distances)
+
+        height = self.grid.height
+        finish_x, finish_y = divmod(finish, height)
+
+        distances = {start: 0}
+        abstract_parents = {}
+        closed = set()
+        queue = [(0, 0, start)]
+
+        while queue:
+            estimate, distance, cell = heapq.heappop(queue)
+            if cell in closed:
+                continue
+
+            closed.add(cell)
+            if cell == finish:
+                break
+
+            if cell not in self.transitions:
+                edges = self._temporary_edges(passable, cell, finish)
+            else:
+                edges = self._cluster_edges(cell_clusters[cell]).get(cell, []) + \
+                    [(other, 1) for other in self.transitions.get(cell, [])]
+                if cell in finish_edges:
+                    edges = edges + [(finish, finish_edges[cell])]
+
+            for other, cost in edges:
+                other_distance = distance + cost
+                if not passable[other] or other in closed:
+                    continue
+
+                if other_distance < distances.get(other, other_distance + 1):
+                    distances[other] = other_distance
+                    abstract_parents[other] = cell
+                    x, y = divmod(other, height)
+                    heapq.heappush(queue, (other_distance + abs(finish_x - x) + abs(finish_y - y), other_distance,
+                                           other))
+
+        if finish not in closed:
+            return None
+
+        abstract_path = [finish]
+        while abstract_path[-1] != start:
+            abstract_path.append(abstract_parents[abstract_path[-1]])
+        abstract_path.reverse()
+
+        return self.refine(passable, abstract_path)
+
+    def _temporary_edges(self, passable, cell, finish):
+        """
+        Рёбра клетки вне абстрактного графа (старт или его сосед за границей кластера): до входов и финиша
+        в её кластере по карте запроса, плюс соседи в других кластерах
+
+        """
+
+        cluster = self.cell_clusters[cell]
+        distances, parents = self._cluster_search(passable, cell)
+
+        edges = [(entrance, distances[entrance]) for entrance in self.entrances[cluster]
+                 if entrance != cell and entrance in distances]
+        if finish in distances:
+            edges.append((finish, distances[finish]))
+        edges += [(i, 1) for i in self.grid.neighbours[cell] if self.cell_clusters[i] != cluster]
+
+        return edges
+
+    def refine(self, passable, abstract_path):
+        path = []
+
+        for cell, next_cell in zip(abstract_path, abstract_path[1:]):
+            if self.cell_clusters[cell] != self.cell_clusters[next_cell]:
+                path.append(next_cell)
+                continue
+
+            distances, parents = self._cluster_search(passable, cell, next_cell)
+            if next_cell not in distances:
+                return None
+
+            segment = [next_cell]
+            while parents.get(segment[-1], cell) != cell:
+                segment.append(parents[segment[-1]])
+            path += segment[::-1]
+
+        # отрезки, уточнённые по отдельности, могут возвращаться в уже пройденные клетки - срезаем петли
+        positions = {abstract_path[0]: -1}
+        out = []
+        for cell in path:
+            if cell in positions:
+                del out[positions[cell] + 1:]
+                positions = dict((c, i) for c, i in positions.iteritems() if i <= positions[cell])
+            else:
+                positions[cell] = len(out)
+                out.append(cell)
+
+        return out
+
+
+def hierarchical_path_finder_for(world):
+    grid = passability_grid_for(world)
+
+    if shared.hierarchical_path_finder is None or shared.hierarchical_path_finder.grid is not grid:
+        shared.hierarchical_path_finder = HierarchicalPathFinder(grid)
+
+    return shared.hierarchical_path_finder
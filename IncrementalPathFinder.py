@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+
+INFINITY = float("inf")
+
+
+class IncrementalPathFinder:
+    """
+    Инкрементальный поиск пути до одной цели (D* Lite) по статической карте с перекрытыми бойцами клетками
+
+    Поиск идёт от цели к бойцу и хранит своё состояние между запросами. Когда набор перекрытых клеток
+    меняется, пересчитываются только вершины вокруг изменившихся клеток, и поиск продолжается с того места,
+    где остановился. Стоимость перепланирования зависит от размера изменения, а не от размера карты.
+    Боец может сместиться между запросами: это учитывается поправкой km к ключам очереди.
+
+    """
+
+    def __init__(self, grid, goal):
+        self.grid = grid
+        self.goal = goal
+        self.blocked = set()
+
+        self.g = {}
+        self.rhs = {goal: 0}
+        self.queue = []
+        self.open_keys = {}
+        self.km = 0
+        self.last_start = None
+
+        self.expanded_count = 0
+
+    def find_path(self, start, blocked):
+        """
+        Путь индексами клеток от start (не включая) до цели (включая) в обход клеток blocked, None - если пути нет
+
+        """
+
+        if self.last_start is None:
+            self.last_start = start
+            self._push(self.goal, self._key(self.goal, start))
+        elif self.last_start != start:
+            self.km += self._heuristic(self.last_start, start)
+            self.last_start = start
+
+        changed_cells = self.blocked.symmetric_difference(blocked)
+        self.blocked = set(blocked)
+
+        for cell in changed_cells:
+            self._update_vertex(cell, start)
+            for i in self.grid.neighbours[cell]:
+                self._update_vertex(i, start)
+
+        self._compute_shortest_path(start)
+
+        if self.g.get(start, INFINITY) == INFINITY:
+            return None
+
+        path = []
+        cell = start
+        while cell != self.goal:
+            cell = min((i for i in self.grid.neighbours[cell] if self._passable(i)),
+                       key=lambda i: self.g.get(i, INFINITY))
+            path.append(cell)
+
+            if len(path) > self.grid.cell_count:
+                return None
+
+        return path
+
+    def _passable(self, cell):
+        return self.grid.passable[cell] and cell not in self.blocked
+
+    def _heuristic(self, cell, other_cell):
+        height = self.grid.height
+        x, y = divmod(cell, height)
+        other_x, other_y = divmod(other_cell, height)
+        return abs(x - other_x) + abs(y - other_y)
+
+    def _key(self, cell, start):
+        value = min(self.g.get(cell, INFINITY), self.rhs.get(cell, INFINITY))
+        return value + self._heuristic(start, cell) + self.km, value
+
+    def _push(self, cell, key):
+        self.open_keys[cell] = key
+        heapq.heappush(self.queue, (key, cell))
+
+    def _top(self):
+        while self.queue:
+            key, cell = self.queue[0]
+            if self.open_keys.get(cell) == key:
+                return key, cell
+            heapq.heappop(self.queue)
+
+        return (INFINITY, INFINITY), None
+
+    def _update_vertex(self, cell, start):
+        if cell != self.goal:
+            if self._passable(cell) or cell == start:
+                self.rhs[cell] = min([self.g.get(i, INFINITY) + 1 for i in self.grid.neighbours[cell]
+                                      if self._passable(i)] + [INFINITY])
+            else:
+                self.rhs[cell] = INFINITY
+
+        self.open_keys.pop(cell, None)
+        if self.g.get(cell, INFINITY) != self.rhs.get(cell, INFINITY):
+            self._push(cell, self._key(cell, start))
+
+    def _compute_shortest_path(self, start):
+        g = self.g
+        rhs = self.rhs
+
+        while True:
+            top_key, cell = self._top()
+            if cell is None or (top_key >= self._key(start, start) and
+                                rhs.get(start, INFINITY) == g.get(start, INFINITY)):
+                break
+
+            new_key = self._key(cell, start)
+            if top_key < new_key:
+                self._push(cell, new_key)
+                continue
+
+            heapq.heappop(self.queue)
+            del self.open_keys[cell]
+            self.expanded_count += 1
+
+            if g.get(cell, INFINITY) > rhs.get(cell, INFINITY):
+                g[cell] = rhs[cell]
+                for i in self.grid.neighbours[cell]:
+                    self._update_vertex(i, start)
+            else:
+                g[cell] = INFINITY
+                self._update_vertex(cell, start)
+                for i in self.grid.neighbours[cell]:
+                    self._update_vertex(i, start)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import time
+from functools import wraps
+
+import SharedVars as shared
+from MyStrategy import MyStrategy
+from RemoteProcessClient import RemoteProcessClient
+from model.World import World
+
+
+# известные горячие места: (класс, метод, имя в отчёте)
+HOT_SPOTS = [
+    (MyStrategy, "find_path_from_to", "MyStrategy.find_path_from_to"),
+    (MyStrategy, "cell_attack_rank", "MyStrategy.cell_attack_rank"),
+    (MyStrategy, "select_enemy", "MyStrategy.select_enemy"),
+    (World, "is_visible", "World.is_visible"),
+    (RemoteProcessClient, "read_world", "RemoteProcessClient.read_world"),
+    (RemoteProcessClient, "read_cell_visibilities", "RemoteProcessClient.read_cell_visibilities"),
+]
+
+
+class FunctionStats:
+    """
+    Счётчики одной функции: число вызовов, суммарное и наибольшее время,
+    гистограмма задержек по степеням двойки в микросекундах (корзина b - от 2 ** (b - 1) до 2 ** b мкс)
+
+    """
+
+    HISTOGRAM_SIZE = 24
+
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.histogram = [0] * FunctionStats.HISTOGRAM_SIZE
+
+    def add(self, elapsed):
+        self.calls += 1
+        self.total_time += elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+        self.histogram[min(int(elapsed * 1000000).bit_length(), FunctionStats.HISTOGRAM_SIZE - 1)] += 1
+
+    def report(self):
+        last_bucket = FunctionStats.HISTOGRAM_SIZE - 1
+        histogram = dict(("<%dus" % (1 << bucket) if bucket < last_bucket else ">=%dus" % (1 << (bucket - 1)), count)
+                         for bucket, count in enumerate(self.histogram) if count)
+
+        return dict(calls=self.calls, total_ms=round(self.total_time * 1000, 3),
+                    mean_us=round(self.total_time / self.calls * 1000000, 3) if self.calls else None,
+                    max_us=round(self.max_time * 1000000, 3), histogram=histogram)
+
+
+class Instrumentation:
+    """
+    Лёгкие замеры горячих мест без профилировщика, по умолчанию выключены
+
+    enable подменяет методы из HOT_SPOTS обёртками с замером времени, disable возвращает исходные,
+    так что выключенные замеры ничего не стоят. Включённые добавляют к вызову два чтения часов и обновление
+    счётчиков. Отчёт - JSON по функциям (см. FunctionStats.report).
+
+    """
+
+    def __init__(self):
+        self.stats = {}
+        self.patches = []
+
+    def wrap(self, label, function):
+        stats = self.stats.setdefault(label, FunctionStats())
+        clock = time.time
+
+        @wraps(function)
+        def timed(*args, **kwargs):
+            started_at = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stats.add(clock() - started_at)
+
+        return timed
+
+    def instrument(self, owner, name, label=None):
+        original = owner.__dict__[name]
+        label = label or "%s.%s" % (owner.__name__, name)
+
+        if isinstance(original, staticmethod):
+            setattr(owner, name, staticmethod(self.wrap(label, original.__func__)))
+        else:
+            setattr(owner, name, self.wrap(label, original))
+
+        self.patches.append((owner, name, original))
+
+    def enable(self, hot_spots=HOT_SPOTS):
+        for owner, name, label in hot_spots:
+            self.instrument(owner, name, label)
+
+    def disable(self):
+        while self.patches:
+            owner, name, original = self.patches.pop()
+            setattr(owner, name, original)
+
+    def report(self):
+        out = dict((label, stats.report()) for label, stats in self.stats.iteritems() if stats.calls)
+
+        # попадания общего кеша путей - чтобы эффект кеша был виден рядом со временем поиска пути
+        if shared.path_cache is not None:
+            out["PathCache"] = shared.path_cache.stats()
+
+        return out
+
+    def dump(self, path):
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp_path, "w") as report_file:
+            json.dump(self.report(), report_file, indent=2, sort_keys=True)
+        os.rename(temp_path, path)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import time
+from math import ceil
+
+import SharedVars as shared
+
+
+class MoveDeadline:
+    """
+    Бюджет времени на один вызов стратегии
+
+    Создаётся в начале хода и вешается на снимок мира (см. deadline_for). Дорогие этапы хода (поиск пути,
+    выбор позиции медика, планирование атаки) спрашивают running_low и при нехватке времени берут
+    закешированный или более дешёвый ответ вместо полного расчёта.
+
+    """
+
+    def __init__(self, budget, clock=time.time):
+        self.budget = budget
+        self.clock = clock
+        self.started_at = clock()
+
+    def elapsed(self):
+        return self.clock() - self.started_at
+
+    def remaining(self):
+        return self.budget - self.elapsed()
+
+    def running_low(self, reserve=0.0):
+        return self.remaining() <= reserve
+
+
+UNLIMITED = MoveDeadline(float("inf"))
+
+
+def deadline_for(world):
+    """
+    Бюджет текущего хода; вне хода стратегии (разбор записей, симуляции этапов по отдельности) - без ограничения
+
+    """
+
+    return getattr(world, "move_deadline", None) or UNLIMITED
+
+
+def record_move_latency(latency):
+    if shared.move_latencies is None:
+        shared.move_latencies = []
+
+    shared.move_latencies.append(latency)
+
+
+def latency_percentiles(latencies, budget=None):
+    """
+    Задержки ходов за игру: число ходов, перцентили p50 / p90 / p99 и максимум в мс,
+    и сколько ходов вышло за бюджет budget (если задан)
+
+    """
+
+    latencies = sorted(latencies or [])
+    if not latencies:
+        return dict(count=0)
+
+    def percentile(rank):
+        return round(latencies[max(int(ceil(rank / 100.0 * len(latencies))) - 1, 0)] * 1000, 3)
+
+    out = dict(count=len(latencies), p50=percentile(50), p90=percentile(90), p99=percentile(99),
+               max=percentile(100))
+    if budget is not None:
+        out["over_budget"] = len([latency for latency in latencies if latency > budget])
+
+    return out
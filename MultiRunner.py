@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import json
+import logging
+import os
+import select
+import sys
+import SharedVars as shared
+from MoveDeadline import latency_percentiles
+from MyStrategy import MyStrategy, MOVE_time_budget
+from RemoteProcessClient import RemoteProcessClient
+from model.Move import Move
+
+
+LOCAL_RUNNER_PROPERTIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                            "local-runner", "local-runner.properties")
+
+
+def read_base_adapter_port(properties_path=LOCAL_RUNNER_PROPERTIES_PATH, default=31001):
+    if not os.path.isfile(properties_path):
+        return default
+
+    with open(properties_path) as properties_file:
+        for line in properties_file:
+            key, separator, value = line.partition("=")
+            if separator and key.strip() == "base-adapter-port" and value.strip():
+                return int(value)
+
+    return default
+
+
+class IncompleteMessage(Exception):
+    pass
+
+
+class FrameStream:
+    """
+    Входящий поток игры, накопленный из сокета: клиент читает из него вместо сокета
+
+    У протокола нет длины сообщения, поэтому границу сообщения находим пробным разбором: fill забирает из сокета
+    то, что уже пришло (сокет готов по select и не блокирует), а чтение дальше накопленного бросает
+    IncompleteMessage вместо ожидания. Тогда разбор откатываем к началу сообщения (rewind) и ждём следующей порции;
+    после полного сообщения прочитанные байты отбрасываем (commit).
+
+    """
+
+    def __init__(self, socket_):
+        self.socket = socket_
+        self.data = bytearray()
+        self.position = 0
+
+    @property
+    def received_byte_count(self):
+        # для индекса записи (StreamRecorder): накопленное, но ещё не разобранное клиентом - не в счёт
+        return self.socket.received_byte_count - (len(self.data) - self.position)
+
+    def fill(self):
+        chunk = bytearray(RemoteProcessClient.READ_BUFFER_SIZE_BYTES)
+        chunk_size = self.socket.recv_into(chunk)
+
+        self.data += buffer(chunk, 0, chunk_size)
+        return chunk_size > 0
+
+    def has_unread_bytes(self):
+        return self.position < len(self.data)
+
+    def recv_into(self, buffer_, byte_count=0):
+        chunk_size = min(byte_count or len(buffer_), len(self.data) - self.position)
+        if not chunk_size:
+            raise IncompleteMessage()
+
+        buffer_[:chunk_size] = buffer(self.data, self.position, chunk_size)
+        self.position += chunk_size
+        return chunk_size
+
+    def rewind(self):
+        self.position = 0
+
+    def commit(self, unread_byte_count=0):
+        del self.data[:self.position - unread_byte_count]
+        self.position = 0
+
+    def __getattr__(self, name):
+        return getattr(self.socket, name)
+
+
+class GameSession:
+    """
+    Одна игра local-runner'а: своё соединение, свои стратегии и своя копия SharedVars
+
+    receive вызывается, когда сокет игры готов по select: забирает пришедшие байты и обрабатывает только
+    полностью пришедшие сообщения (см. FrameStream), поэтому никогда не ждёт ни на своём, ни на чужом сокете.
+
+    """
+
+    TEAM_SIZE = 0
+    GAME_CONTEXT = 1
+    PLAYING = 2
+    GAME_OVER = 3
+
+    def __init__(self, host, port, token, cell_visibilities_cache_dir=None, record_path=None,
+                 compact_cell_visibilities=False, trooper_tables=False):
+        self.port = port
+        self.remote_process_client = RemoteProcessClient(host, port, cell_visibilities_cache_dir, record_path,
+                                                         compact_cell_visibilities, trooper_tables)
+        self.frame_stream = FrameStream(self.remote_process_client.socket)
+        self.remote_process_client.socket = self.frame_stream
+        if self.remote_process_client.recorder is not None:
+            self.remote_process_client.recorder = self.frame_stream
+        self.remote_process_client.write_token(token)
+
+        self.state = GameSession.TEAM_SIZE
+        self.team_size = None
+        self.game = None
+        self.strategies = None
+        self.shared_state = copy.deepcopy(dict((name, value) for name, value in vars(shared).iteritems()
+                                               if not name.startswith("_")))
+
+    def fileno(self):
+        return self.remote_process_client.fileno()
+
+    def receive(self):
+        if not self.frame_stream.fill():
+            raise IOError("Game on port %d closed the connection." % self.port)
+
+        while self.state != GameSession.GAME_OVER and self.frame_stream.has_unread_bytes() and self.step():
+            pass
+
+        return self.state != GameSession.GAME_OVER
+
+    def step(self):
+        """
+        Обрабатываем одно сообщение, если оно пришло целиком; False - ждём остальные байты
+
+        """
+
+        client = self.remote_process_client
+        # клетки и видимости клиент кеширует по ходу разбора первого мира - при откате возвращаем как было
+        cells, cell_visibilities = client.cells, client.cell_visibilities
+
+        try:
+            self._handle_message()
+        except IncompleteMessage:
+            client.cells, client.cell_visibilities = cells, cell_visibilities
+            client.read_buffer_offset = client.read_buffer_length = 0
+            self.frame_stream.rewind()
+            return False
+
+        # остаток буфера клиента - уже начало следующего сообщения, его разберём заново из FrameStream
+        self.frame_stream.commit(client.read_buffer_length - client.read_buffer_offset)
+        client.read_buffer_offset = client.read_buffer_length = 0
+        return True
+
+    def _handle_message(self):
+        if self.state == GameSession.TEAM_SIZE:
+            self.team_size = self.remote_process_client.read_team_size()
+            self.remote_process_client.write_protocol_version()
+            self.state = GameSession.GAME_CONTEXT
+        elif self.state == GameSession.GAME_CONTEXT:
+            self.game = self.remote_process_client.read_game_context()
+            self.strategies = [MyStrategy() for strategy_index in xrange(self.team_size)]
+            self.state = GameSession.PLAYING
+        elif self.state == GameSession.PLAYING:
+            player_context = self.remote_process_client.read_player_context()
+            if player_context is None:
+                self.state = GameSession.GAME_OVER
+                logging.info("game on port %d move latency %s" % (self.port, json.dumps(
+                    latency_percentiles(self.shared_state["move_latencies"], MOVE_time_budget), sort_keys=True
+                )))
+                if self.shared_state["path_cache"] is not None:
+                    logging.info("game on port %d path cache %s" % (self.port, json.dumps(
+                        self.shared_state["path_cache"].stats(), sort_keys=True
+                    )))
+                return
+
+            player_trooper = player_context.trooper
+
+            move = Move()
+            self._restore_shared_state()
+            try:
+                self.strategies[player_trooper.teammate_index].move(player_trooper, player_context.world, self.game,
+                                                                    move)
+            finally:
+                self._save_shared_state()
+            self.remote_process_client.write_move(move)
+
+    def _restore_shared_state(self):
+        for name, value in self.shared_state.iteritems():
+            setattr(shared, name, value)
+
+    def _save_shared_state(self):
+        for name in self.shared_state:
+            self.shared_state[name] = getattr(shared, name)
+
+    def close(self):
+        self.remote_process_client.close()
+
+
+class MultiRunner:
+    """
+    Ведёт несколько игр local-runner'ов на последовательных портах в одном процессе (один цикл на select)
+
+    """
+
+    def __init__(self, game_count, host="127.0.0.1", base_port=None, token="0000000000000000"):
+        self.game_count = game_count
+        self.host = host
+        self.base_port = read_base_adapter_port() if base_port is None else base_port
+        self.token = token
+        self.cell_visibilities_cache_dir = os.environ.get("CELL_VISIBILITIES_CACHE_DIR")
+        self.record_path = os.environ.get("PROTOCOL_RECORD_PATH")
+        self.compact_cell_visibilities = bool(os.environ.get("COMPACT_CELL_VISIBILITIES"))
+        self.trooper_tables = bool(os.environ.get("TROOPER_TABLES"))
+
+    def run(self):
+        sessions = []
+
+        try:
+            for game_index in xrange(self.game_count):
+                port = self.base_port + game_index
+                record_path = None if self.record_path is None else "%s.%d" % (self.record_path, port)
+
+                sessions.append(GameSession(self.host, port, self.token, self.cell_visibilities_cache_dir,
+                                            record_path, self.compact_cell_visibilities, self.trooper_tables))
+
+            active_sessions = list(sessions)
+
+            while active_sessions:
+                ready_sessions, _, _ = select.select(active_sessions, [], [])
+
+                for session in ready_sessions:
+                    try:
+                        in_progress = session.receive()
+                    except Exception:
+                        # падение одной игры (в том числе стратегии) не останавливает остальные
+                        logging.exception("game on port %d failed" % session.port)
+                        in_progress = False
+
+                    if not in_progress:
+                        active_sessions.remove(session)
+                        session.close()
+        finally:
+            for session in sessions:
+                session.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5:
+        MultiRunner(int(sys.argv[1]), sys.argv[2], int(sys.argv[3]), sys.argv[4]).run()
+    elif len(sys.argv) == 2:
+        MultiRunner(int(sys.argv[1])).run()
+    else:
+        sys.stderr.write("usage: MultiRunner.py <game count> [<host> <base port> <token>]\n")
+        sys.exit(1)
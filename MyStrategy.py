@@ -3,17 +3,28 @@
 
 
 import logging
+import os
 
-import copy
 from math import *
-from random import shuffle
 
 import SharedVars as shared
+from DistanceField import distance_fields_for
+from Engagement import engagement_for
+from GrenadePlanner import grenade_planner_for
+from HierarchicalPathFinder import hierarchical_path_finder_for
+from IncrementalPathFinder import IncrementalPathFinder
+from MoveDeadline import MoveDeadline, deadline_for, record_move_latency
+from PassabilityGrid import passability_grid_for
+from PathCache import path_cache_for
+from PathFinder import PathFinder
+from ThreatMap import threat_map_for
+from TurnPlanner import TurnPlanner
+from WaypointPlanner import WaypointPlanner
+from WorldIndex import world_index_for
 
 from model.ActionType import ActionType
 from model.TrooperStance import TrooperStance
 from model.TrooperType import TrooperType
-from model.CellType import CellType
 from model.BonusType import BonusType
 
 
@@ -21,6 +32,9 @@ from model.BonusType import BonusType
 CF_range_from_team = 1.1
 CF_range_from_team_medic = 0.9
 
+# каталог для кеша вейпоинтов по картам (None - не кешировать)
+WAYPOINTS_cache_dir = os.environ.get('WAYPOINTS_CACHE_DIR')
+
 # коэф. для вычисления максимальной дальности юнита от вейпоинта
 CF_range_from_waypoint = 0.5
 
@@ -33,131 +47,68 @@ CF_medkit_bonus_hits = 0.8
 # радиус обзора, в пределах которого юниты кидаются за бонусом
 CF_range_bonus_for_me = 3.0
 
-# максимальное количество фейлов, после которого кеш поиска пути принудительно сбрасывается
-PATH_cache_failed_limit = 6
-
-
-def log_it(msg, level='info'):
-    getattr(logging, level)(msg)
-
-
-def distance_from_to(coord_from, coord_to):
-    return hypot(coord_to[0] - coord_from[0], coord_to[1] - coord_from[1])
+# поиск пути в обход бойцов (когда спуск по полю расстояний перекрыт): A* вместо BFS,
+# и зерно детерминированного выбора среди равных путей (None - случайный выбор; действует и на спуск по полю)
+PATH_search_use_astar = False
+PATH_tie_break_seed = None
 
+# Jump Point Search вместо BFS/A* (для больших открытых карт)
+PATH_search_use_jps = False
 
-def filter_free_wave(map_, val=None):
-    if val is None:
-        func = lambda x: (x['wave_num'] is None)
-    else:
-        func = lambda x: (x['wave_num'] == val)
+# обход занятых бойцами клеток инкрементальным поиском (D* Lite) вместо поиска с нуля;
+# явно выбранный A* или JPS важнее - тогда обход ищется ими
+PATH_incremental_repair = True
 
-    waves = []
-    for row in map_:
-        waves += filter(func, row)
+# начиная с такого числа клеток карты путь ищется иерархически (HPA*), без полей расстояний
+PATH_hierarchical_min_cells = 10000
 
-    return filter(lambda x: x['passability'], waves)
+# планирование хода при атаке: время, сек, и предел числа узлов перебора; оба 0 - только жадные правила
+# по умолчанию - только предел узлов: глубина перебора по времени делает игры невоспроизводимыми,
+# а время тогда ограничено лишь бюджетом хода; 2000 узлов - до ~40 мс на план на записанных играх
+PLAN_time_budget = 0
+PLAN_node_limit = 2000
 
+# коэф. штрафа за урон, под который встаёт боец в конце спланированного хода
+CF_plan_exposure = 0.5
 
-def find_cell_neighborhood(coord, map_, allow_diagonaly=False):
-    out = []
+# бюджет времени на ход стратегии, сек
+MOVE_time_budget = 0.2
 
-    if coord[0] > 0:
-        try:
-            out.append(map_[coord[0]-1][coord[1]])
-        except IndexError:
-            pass
+# остаток бюджета хода, сек, при котором дорогие этапы берут закешированный или упрощённый ответ
+MOVE_time_reserve = 0.05
 
-    try:
-        out.append(map_[coord[0]+1][coord[1]])
-    except IndexError:
-        pass
-
-    if coord[1] > 0:
-        try:
-            out.append(map_[coord[0]][coord[1]-1])
-        except IndexError:
-            pass
 
-    try:
-        out.append(map_[coord[0]][coord[1]+1])
-    except IndexError:
-        pass
-
-    if allow_diagonaly:
-        try:
-            out.append(map_[coord[0]+1][coord[1]+1])
-        except IndexError:
-            pass
-
-        if coord[0] > 0:
-            try:
-                out.append(map_[coord[0]-1][coord[1]+1])
-            except IndexError:
-                pass
-
-        if coord[1] > 0:
-            try:
-                out.append(map_[coord[0]+1][coord[1]-1])
-            except IndexError:
-                pass
-
-        if coord[0] > 0 and coord[1] > 0:
-            try:
-                out.append(map_[coord[0]-1][coord[1]-1])
-            except IndexError:
-                pass
-
-    return filter(lambda x: x['passability'], out)
-
-
-def get_waypoint_near_of_coord(cells, coord):
-    """
-    Возвращаем координаты свободного вейпоинта поблизости от требуемых координат
+def log_it(msg, level='info'):
+    getattr(logging, level)(msg)
 
-    """
 
-    map_ = []
-    for x, row in enumerate(cells):
-        for y, v in enumerate(row):
-            if v == CellType.FREE:
-                map_.append(dict(coord=(x, y), distance=distance_from_to(coord, (x, y))))
-    return sorted(map_, key=lambda x: x['distance'])[0]['coord']
+def distance_from_to(coord_from, coord_to):
+    return hypot(coord_to[0] - coord_from[0], coord_to[1] - coord_from[1])
 
 
 class MyStrategy:
 
     def __init__(self):
-        self.current_path = None
-        self.cache_failed_count = 0
+        self.replanner = None
         logging.basicConfig(
             format='%(asctime)s %(levelname)s:%(message)s',
             level=logging.INFO)
 
     def move(self, me, world, game, move):
+        deadline = world.move_deadline = MoveDeadline(MOVE_time_budget)
+
         log_it('<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<')
         log_it('new move turn %d unit %d (%s)' % (world.move_index, me.id, str((me.x, me.y))))
 
-        if shared.way_points is None:
-            self._compute_waypoints(world)
-
-        self._action_base(me, world, game, move)
-        log_it('>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>')
-
-    @property
-    def current_path(self):
-        return self._current_path
-
-    @current_path.setter
-    def current_path(self, value):
-        self._current_path = value
+        try:
+            if shared.way_points is None:
+                self._compute_waypoints(world)
 
-    @property
-    def cache_failed_count(self):
-        return self._cache_failed_count
+            self._action_base(me, world, game, move)
+        finally:
+            record_move_latency(deadline.elapsed())
 
-    @cache_failed_count.setter
-    def cache_failed_count(self, value):
-        self._cache_failed_count = value
+        log_it('>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>')
 
     @staticmethod
     def select_action_by_type(type_):
@@ -173,9 +124,7 @@ class MyStrategy:
 
         """
 
-        current_x = [t.x for t in world.troopers if t.teammate]
-        current_y = [t.y for t in world.troopers if t.teammate]
-        return int(sum(current_x) / len(current_x)), int(sum(current_y) / len(current_y))
+        return world_index_for(world).team_coord
 
     @staticmethod
     def team_avg_shooting_range(world):
@@ -184,36 +133,24 @@ class MyStrategy:
 
         """
 
-        ranges = [t.shooting_range for t in world.troopers if t.teammate]
-        return sum(ranges) / len(ranges)
+        return world_index_for(world).team_avg_shooting_range
 
     def _compute_waypoints(self, world):
         """
         Вычисляем waypoint-ы - сперва все углы прямоугольной карты а в конец добавляем координаты центра
         берём только свободные от препятствий точки на карте (в окресностях углов и центра)
+        углы обходим в порядке кратчайшего по длине путей маршрута (см. WaypointPlanner)
 
         """
 
         current_coord = self.team_avg_coord(world)
         log_it("compute current command coord %s" % str(current_coord))
 
-        center_coord = get_waypoint_near_of_coord(world.cells, (int(world.width / 2), int(world.height / 2)))
+        # пути считаем от бойца отряда, ближайшего к его центру (сам центр может оказаться в препятствии)
+        source = min([(t.x, t.y) for t in world_index_for(world).teammates],
+                     key=lambda c: distance_from_to(current_coord, c))
 
-        angles = [
-            get_waypoint_near_of_coord(world.cells, (0, 0)),
-            get_waypoint_near_of_coord(world.cells, (0, world.height - 1)),
-            get_waypoint_near_of_coord(world.cells, (world.width - 1, world.height - 1)),
-            get_waypoint_near_of_coord(world.cells, (world.width - 1, 0))]
-
-        sorted_waypoints = []
-        for k in xrange(len(angles)):
-            if k == 0:
-                angles = sorted(angles, key=lambda i: distance_from_to(current_coord, i))
-            else:
-                angles = sorted(angles, key=lambda i: distance_from_to(sorted_waypoints[k-1], i))
-            sorted_waypoints.append(angles.pop(0))
-
-        sorted_waypoints.append(center_coord)
+        sorted_waypoints = WaypointPlanner(world, WAYPOINTS_cache_dir).plan(source)
         shared.way_points = sorted_waypoints
         log_it('select %s waypoints' % str(sorted_waypoints))
 
@@ -243,17 +180,17 @@ class MyStrategy:
         """
 
         shoot_range = self.team_avg_shooting_range(world)
-        ranges_to_team = [me.get_distance_to(t.x, t.y) for t in world.troopers if t.teammate and t.id != me.id]
+        max_range_to_team = world_index_for(world).max_distance_to_team(me)
         coef = CF_range_from_team if not is_medic else CF_range_from_team_medic
-        if len(ranges_to_team) == 0:
+        if max_range_to_team is None:
             return False
         else:
-            return max(ranges_to_team) > shoot_range * coef
+            return max_range_to_team > shoot_range * coef
 
     @staticmethod
     def need_to_wait_medic(me, world):
         return me.type != TrooperType.FIELD_MEDIC and me.hitpoints < me.maximal_hitpoints and \
-               len([t for t in world.troopers if t.teammate and t.type == TrooperType.FIELD_MEDIC]) == 1
+               len([t for t in world_index_for(world).teammates if t.type == TrooperType.FIELD_MEDIC]) == 1
 
     @staticmethod
     def could_and_need_use_ration(me, game):
@@ -261,12 +198,10 @@ class MyStrategy:
 
     @staticmethod
     def get_coord_for_escape_from_attack(me, world):
-        map_passability = [[dict(coord=(x, y), passability=(v == CellType.FREE)) for y, v in enumerate(row)]
-                           for x, row in enumerate(world.cells)]
+        grid = passability_grid_for(world)
 
-        escape_cells = [c['coord'] for c in find_cell_neighborhood((me.x, me.y), map_passability)]
-        filtered_cells = filter(lambda x: MyStrategy.cell_free_for_move(x, world), escape_cells)
-        sorted_coords = sorted(filtered_cells, key=lambda e: MyStrategy.cell_attack_rank(e, world))
+        escape_cells = grid.free_neighbours((me.x, me.y), passable=grid.overlay_for(world))
+        sorted_coords = sorted(escape_cells, key=lambda e: MyStrategy.cell_attack_rank(e, world))
 
         if len(sorted_coords) > 0 and \
            MyStrategy.cell_attack_rank(sorted_coords[0], world) < MyStrategy.cell_attack_rank((me.x, me.y), world):
@@ -275,18 +210,22 @@ class MyStrategy:
             return None
 
     @staticmethod
-    def could_and_need_use_grenade(me, enemy, game, world):
-
-        # проверяем, не заденем ли мы союзных юнитов
-        map_passability = [[dict(coord=(x, y), passability=(v == CellType.FREE)) for y, v in enumerate(row)]
-                           for x, row in enumerate(world.cells)]
-        damage_cells = [c['coord'] for c in find_cell_neighborhood((enemy.x, enemy.y), map_passability)]
-        if len([t for t in world.troopers if t.teammate and (t.x, t.y) in damage_cells]) > 0:
-            log_it('not use grenade (team units are damaged)')
-            return False
+    def select_grenade_target(me, game, world):
+        """
+        Клетка для броска гранаты с наибольшим уроном врагам без задевания своих (см. GrenadePlanner)
+
+        :rtype (x, y) or None
+        """
+
+        if me.action_points < game.grenade_throw_cost or not me.holding_grenade:
+            return None
 
-        return me.action_points >= game.grenade_throw_cost and me.holding_grenade and \
-               world.is_visible(game.grenade_throw_range, me.x, me.y, me.stance, enemy.x, enemy.y, enemy.stance)
+        target = grenade_planner_for(world, game).best_target(me, world, game)
+        if target is None:
+            return None
+
+        log_it('grenade target %s (damage %d)' % (str(target[:2]), target[2]))
+        return target[:2]
 
     def find_bonus(self, me, world):
         """
@@ -309,7 +248,7 @@ class MyStrategy:
                                    me.get_distance_to_unit(b) <= CF_range_bonus_for_me, world.bonuses)
 
         if len(bonuses) > 0:
-            return sorted(bonuses, key=lambda b: me.get_distance_to_unit(b))[0]
+            return self.nearest_by_path(world, (me.x, me.y), bonuses, lambda b: (b.x, b.y))
         else:
             return None
 
@@ -325,10 +264,33 @@ class MyStrategy:
     def heal_avaliable(me, enemy):
         return me.get_distance_to(enemy.x, enemy.y) <= 1.0
 
+    @staticmethod
+    def nearest_by_path(world, coord_from, items, coord_of):
+        """
+        Ближайший по длине пути элемент (бонус, боец, клетка); длины до всех считаются одним поиском
+        по карте без бойцов, при равных длинах и недостижимых - по расстоянию по прямой
+        Если время хода на исходе - сразу по расстоянию по прямой
+
+        """
+
+        if deadline_for(world).running_low(MOVE_time_reserve):
+            return min(items, key=lambda item: distance_from_to(coord_from, coord_of(item)))
+
+        grid = passability_grid_for(world)
+        start = grid.index(*coord_from)
+        pairs = [(start, grid.index(*coord_of(item))) for item in items]
+        paths = PathFinder(grid).batch(grid.passable, pairs)
+
+        def rank(item_pair):
+            item, pair = item_pair
+            return paths[pair] is None, paths[pair] and paths[pair][0], distance_from_to(coord_from, coord_of(item))
+
+        return sorted(zip(items, pairs), key=rank)[0][0]
+
     @staticmethod
     def cell_free_for_move(coord, world):
-        troopers_coord = [t for t in world.troopers if (t.x, t.y) == coord]
-        return world.cells[coord[0]][coord[1]] == CellType.FREE and len(troopers_coord) == 0
+        grid = passability_grid_for(world)
+        return grid.overlay_for(world)[grid.index(*coord)] == 1
 
     def select_heal_enemy(self, me, world, is_soldier=False):
         """
@@ -337,7 +299,7 @@ class MyStrategy:
         :rtype Trooper or None
         """
 
-        units_for_heal = [t for t in world.troopers if t.teammate and t.hitpoints < t.maximal_hitpoints]
+        units_for_heal = [t for t in world_index_for(world).teammates if t.hitpoints < t.maximal_hitpoints]
         if len(units_for_heal) == 0:
             return None
 
@@ -354,7 +316,7 @@ class MyStrategy:
         elif is_soldier:
             return None
         else:
-            return sorted(units_for_heal, key=lambda u: me.get_distance_to(u.x, u.y))[0]
+            return self.nearest_by_path(world, (me.x, me.y), units_for_heal, lambda u: (u.x, u.y))
 
     def select_position_for_medic(self, me, world):
         """
@@ -364,14 +326,13 @@ class MyStrategy:
 
         """
 
-        troopers = [t for t in world.troopers if t.teammate and t.id != me.id]
-        map_passability = [[dict(coord=(x, y), passability=(v == CellType.FREE)) for y, v in enumerate(row)]
-                           for x, row in enumerate(world.cells)]
+        troopers = [t for t in world_index_for(world).teammates if t.id != me.id]
+        grid = passability_grid_for(world)
 
         cells = []
         for t in troopers:
-            cells += find_cell_neighborhood((t.x, t.y), map_passability, True)
-        sorted_coords = sorted([c['coord'] for c in cells], key=lambda e: self.cell_attack_rank(e, world))
+            cells += grid.free_neighbours((t.x, t.y), True)
+        sorted_coords = sorted(cells, key=lambda e: self.cell_attack_rank(e, world))
 
         if len(sorted_coords) > 0:
             return sorted_coords[0]
@@ -390,22 +351,17 @@ class MyStrategy:
         :rtype Trooper or None
         """
 
-        enemies = [t for t in world.troopers if not t.teammate]
-        if len(enemies) == 0:
+        engagement = engagement_for(world)
+        if len(engagement.enemies) == 0:
             return None
 
-        # проверяем, нет ли среди ближайших врагов такого, которого можно было бы атаковать
-        visible_enemies = [e for e in enemies if world.is_visible(me.shooting_range, me.x, me.y, me.stance, e.x, e.y,
-                                                                  e.stance)]
-        sorted_visible_enemies = sorted(visible_enemies, key=lambda e: e.hitpoints)
-
         # если в досягаемости есть враг, которого мы можем атаковать - берём с минимальным кол-вом хитов
+        sorted_visible_enemies = engagement.shootable_enemies(me)
         if len(sorted_visible_enemies) > 0:
             return sorted_visible_enemies[0]
 
         #иначе берём врага, ближайшего к центру команды
-        team_coord = self.team_avg_coord(world)
-        nearest_enemies = sorted(enemies, key=lambda e: distance_from_to(team_coord, (e.x, e.y)))
+        nearest_enemies = engagement.enemies_by_team_distance
 
         # todo выбор тех, кто может стрелять в нас всегда приоритетнее, чем те, которые не могут дострелить до команды
 
@@ -420,9 +376,8 @@ class MyStrategy:
 
     @staticmethod
     def cell_attack_rank(coord, world):
-        return len([t for t in world.troopers if not t.teammate and world.is_visible(t.shooting_range, t.x, t.y,
-                                                                                     t.stance, coord[0], coord[1],
-                                                                                     TrooperStance.STANDING)])
+        threat_map = threat_map_for(world, deadline_for(world).running_low(MOVE_time_reserve))
+        return threat_map.enemy_count(coord[0], coord[1], TrooperStance.STANDING)
 
     def find_path_from_to(self, world, coord_from, coord_to, use_cache=True):
         """
@@ -430,13 +385,17 @@ class MyStrategy:
         Если одна из точек непроходима или выходит за пределы поля - отдаём пустой список
         Если в точку финиша ну никак не придти - отдаём пустой список
 
+        Сначала - спуск по общему полю расстояний до цели (на больших картах - HPA*). Поиск PathFinder
+        (BFS, A* или JPS по PATH_search_use_astar / PATH_search_use_jps) нужен, только если спуск перекрыт
+        бойцами: тогда обход ищет он, если выбран A* или JPS, иначе D* Lite (PATH_incremental_repair)
+
         :rtype : list of simplest path coords
         """
 
         log_it('find path call start (%s to %s)' % (str(coord_from), str(coord_to)))
 
-        if coord_from[0] < 0 or coord_from[0] > world.width or coord_from[1] < 0 or coord_from[1] > world.height or \
-            coord_to[0] < 0 or coord_to[0] > world.width or coord_to[1] < 0 or coord_to[1] > world.height:
+        if coord_from[0] < 0 or coord_from[0] >= world.width or coord_from[1] < 0 or coord_from[1] >= world.height or \
+            coord_to[0] < 0 or coord_to[0] >= world.width or coord_to[1] < 0 or coord_to[1] >= world.height:
 
             log_it('invalid point for find_path_from_to %s %s' % (str(coord_from), str(coord_to)), 'error')
             return []
@@ -444,82 +403,100 @@ class MyStrategy:
         if coord_from == coord_to:
             return []
 
-        if self.current_path is not None and use_cache and self.cache_failed_count <= PATH_cache_failed_limit:
-            try:
-                start_index = self.current_path.index(coord_from)
-                end_index = self.current_path.index(coord_to)
-            except ValueError:
-                log_it('get path from cache failed')
-            else:
-                log_it('cached path found (%s %s)' % (str(start_index), str(end_index)))
-                if start_index < end_index:
-                    path = self.current_path[start_index+1:end_index]
-                else:
-                    path = self.current_path[end_index+1:start_index][::-1]
-                return path
-
-        # карта проходимости юнитов
-        map_passability = [[dict(coord=(x, y), passability=(v == CellType.FREE), wave_num=None)
-                            for y, v in enumerate(row)] for x, row in enumerate(world.cells)]
-
-        # отмечаем юнитов в радиусе одного шага как непроходимые препятствия
-        short_radius_neibs = [x['coord'] for x in find_cell_neighborhood(coord_from, map_passability)]
-        for t in world.troopers:
-            try:
-                short_radius_neibs.index((t.x, t.y))
-                map_passability[t.x][t.y]['passability'] = False
-            except ValueError:
-                pass
-
-        # Алгоритм Ли для поиска пути из coord_from в coord_to
-        map_passability[coord_from[0]][coord_from[1]]['wave_num'] = 0
-        map_passability[coord_from[0]][coord_from[1]]['passability'] = True
-        last_wave_num = 0
-
-        # обходим волнами все ячейки, ещё не задетые другими волнами
-        while True:
-            wave_cells = filter_free_wave(map_passability, val=last_wave_num)
-            tmp = copy.deepcopy(map_passability)
-            last_wave_num += 1
-            for cell in wave_cells:
-                neighborhoods = find_cell_neighborhood(cell['coord'], map_passability)
-                for item in neighborhoods:
-                    if item['wave_num'] is None:
-                        item['wave_num'] = last_wave_num
-
-            if (len(filter_free_wave(map_passability, val=None)) == 0) or \
-                    (map_passability[coord_to[0]][coord_to[1]]['wave_num'] is not None) or \
-                    (map_passability == tmp):
-                break
-
-        if map_passability[coord_to[0]][coord_to[1]]['wave_num'] is None:
+        grid = passability_grid_for(world)
+        start = grid.index(*coord_from)
+        finish = grid.index(*coord_to)
+
+        # юниты в радиусе одного шага - непроходимые препятствия, они же отпечаток пути в общем кеше
+        overlay = grid.overlay_for(world)
+        blocked = tuple(grid.coord(i) for i in grid.neighbours[start] if grid.passable[i] and not overlay[i])
+
+        path_cache = path_cache_for(world)
+        if use_cache:
+            out = path_cache.get(coord_from, coord_to, blocked)
+            if out is not None:
+                log_it('cached path found %s' % str(out))
+                return out
+
+        passable = bytearray(grid.passable)
+        for coord in blocked:
+            passable[grid.index(*coord)] = 0
+        passable[start] = 1
+
+        # путь по общему полю расстояний до цели, а если спуск перекрыт бойцами - обычным поиском
+        # на больших картах - иерархическим поиском
+        # если время хода на исходе - только по уже посчитанному полю, иначе шаг в сторону цели
+        # кратчайший путь при перекрытиях shortest_for (пустые - по всей карте); иерархический - не обязательно
+        low_on_time = deadline_for(world).running_low(MOVE_time_reserve)
+        path_finder = PathFinder(grid, PATH_search_use_astar, PATH_tie_break_seed, PATH_search_use_jps)
+        shortest_for = ()
+        if grid.cell_count >= PATH_hierarchical_min_cells:
+            path = None if low_on_time else hierarchical_path_finder_for(world).find_path(passable, start, finish)
+            shortest_for = None
+        else:
+            fields = distance_fields_for(world)
+            field = fields.cached_field(finish) if low_on_time else fields.field(finish)
+            if field is not None and field.distance(start) < 0 and grid.passable[start]:
+                return []
+
+            path = None if field is None else field.descend(passable, start,
+                                                            path_finder.tie_break_shuffle(start, finish))
+
+        if path is None and low_on_time:
+            log_it('move deadline is close, step towards %s without path search' % str(coord_to), 'warn')
+            return self._step_towards(grid, passable, start, finish)
+        if path is None:
+            path = self._repair_path(grid, start, finish, blocked, path_finder)
+            shortest_for = blocked
+        if path is None:
             return []
 
-        end_point = map_passability[coord_to[0]][coord_to[1]]
-
-        # восстанавливаем кратчайший путь до стартовой ячейки
-        path = [end_point]
-        while True:
-            current_cell = path[-1]
-            neighborhoods = find_cell_neighborhood(current_cell['coord'], map_passability)
-            cells = filter(lambda x: (x['wave_num'] == current_cell['wave_num'] - 1), neighborhoods)
-            shuffle(cells)
+        out = [grid.coord(i) for i in path]
 
-            new_cell = cells.pop()
-            if new_cell['wave_num'] > 0:
-                path.append(new_cell)
-            else:
-                break
-
-        path.reverse()
-        out = [i['coord'] for i in path]
-
-        self.current_path = out
+        path_cache.put(coord_from, coord_to, blocked, out, shortest_for)
         log_it('new path cached')
 
         log_it('find path call end (%s)' % str(out))
         return out
 
+    @staticmethod
+    def _step_towards(grid, passable, start, finish):
+        """
+        Один шаг в свободную соседнюю клетку, ближайшую к финишу по прямой; не путь, поэтому не кешируется
+
+        """
+
+        finish_coord = grid.coord(finish)
+        cells = [i for i in grid.neighbours[start] if passable[i]]
+        if not cells:
+            return []
+
+        step = min(cells, key=lambda i: distance_from_to(grid.coord(i), finish_coord))
+        if distance_from_to(grid.coord(step), finish_coord) >= distance_from_to(grid.coord(start), finish_coord):
+            return []
+
+        return [grid.coord(step)]
+
+    def _repair_path(self, grid, start, finish, blocked, path_finder):
+        """
+        Путь в обход занятых бойцами клеток: инкрементальный поиск юнита до той же цели чинит прошлый путь
+        только вокруг клеток, которые с прошлого запроса заняли или освободили
+        С выбранным A* / JPS (или без PATH_incremental_repair) - поиск PathFinder с нуля
+
+        """
+
+        if not PATH_incremental_repair or PATH_search_use_astar or PATH_search_use_jps:
+            passable = bytearray(grid.passable)
+            for coord in blocked:
+                passable[grid.index(*coord)] = 0
+            passable[start] = 1
+            return path_finder.find_path(passable, start, finish)
+
+        if self.replanner is None or self.replanner.goal != finish or self.replanner.grid is not grid:
+            self.replanner = IncrementalPathFinder(grid, finish)
+
+        return self.replanner.find_path(start, [grid.index(*coord) for coord in blocked])
+
     @staticmethod
     def _stand_up(move, me, game):
         log_it('start raise stance')
@@ -561,9 +538,8 @@ class MyStrategy:
         else:
             if not self.cell_free_for_move(coord, world):
                 log_it('cell not free')
-                self.cache_failed_count += 1
+                path_cache_for(world).evict(coord)
             else:
-                self.cache_failed_count = 0
                 move.action = ActionType.MOVE
                 move.x = coord[0]
                 move.y = coord[1]
@@ -577,14 +553,27 @@ class MyStrategy:
             move.action = ActionType.EAT_FIELD_RATION
 
     @staticmethod
-    def _shoot_grenade(move, me, enemy, game):
-        log_it('start shoot grenade to %s' % str((enemy.x, enemy.y)))
+    def _shoot_grenade(move, me, coord, game):
+        log_it('start shoot grenade to %s' % str(coord))
         if me.action_points < game.grenade_throw_cost:
             log_it('not enouth AP', 'warn')
         else:
             move.action = ActionType.THROW_GRENADE
-            move.x = enemy.x
-            move.y = enemy.y
+            move.x, move.y = coord
+
+    def _throw_grenade_if_useful(self, move, me, game, world):
+        """
+        Бросаем гранату в лучшую клетку (см. select_grenade_target), если такая есть; True - если бросили
+        Цель ищем только здесь, когда до гранаты дошла очередь, а не на каждом ходе заранее
+
+        """
+
+        grenade_target = self.select_grenade_target(me, game, world)
+        if grenade_target is None:
+            return False
+
+        self._shoot_grenade(move, me, grenade_target, game)
+        return True
 
     @staticmethod
     def _shoot(move, me, enemy):
@@ -616,9 +605,9 @@ class MyStrategy:
             move.x = enemy.x
             move.y = enemy.y
 
-    def _lower_stance_or_shoot(self, move, me, enemy, game):
+    def _lower_stance_or_shoot(self, world, move, me, enemy, game):
         shoots_count = int(floor(me.action_points / me.shoot_cost))
-        if me.get_damage(me.stance) * shoots_count >= enemy.hitpoints:
+        if shoots_count >= engagement_for(world).shots_to_kill_count(me, enemy, me.stance):
             self._shoot(move, me, enemy)
         else:
             if me.stance == TrooperStance.STANDING or (me.stance == TrooperStance.KNEELING and
@@ -655,8 +644,8 @@ class MyStrategy:
         if self.max_range_from_team_exceeded(world, me, me.type == TrooperType.FIELD_MEDIC):
             log_it('max range from team coord exceed')
 
-            team_coords = [(t.x, t.y) for t in world.troopers if t.teammate and t.id != me.id]
-            coords_to = sorted(team_coords, key=lambda c: me.get_distance_to(*c))[0]
+            team_coords = [(t.x, t.y) for t in world_index_for(world).teammates if t.id != me.id]
+            coords_to = self.nearest_by_path(world, (me.x, me.y), team_coords, lambda c: c)
 
             path = self.find_path_from_to(world, (me.x, me.y), coords_to, False)
             log_it('path for return to team %s' % str(path), 'debug')
@@ -702,8 +691,8 @@ class MyStrategy:
         """
 
         heal_enemy = self.select_heal_enemy(me, world)
-        team_size = len([t for t in world.troopers if t.teammate])
-        enemy = self.select_enemy(me, world)  # работает только потому, что дальность броска гранаты равна дальности оружия медика
+        team_size = len(world_index_for(world).teammates)
+        enemy = self.select_enemy(me, world)
         escape_from_attack_coord = self.get_coord_for_escape_from_attack(me, world)
 
         if world.move_index == 0:
@@ -711,13 +700,13 @@ class MyStrategy:
         elif team_size == 1:
             log_it('medic was left alone and move as commander')
             return self._action_commander(me, world, game, move)
-        elif enemy is not None and self.could_and_need_use_grenade(me, enemy, game, world):
+        elif enemy is not None and self._throw_grenade_if_useful(move, me, game, world):
             log_it('medic throw grenade')
-            return self._shoot_grenade(move, me, enemy, game)
+            return
         elif heal_enemy is None:
             log_it('medic mode on')
-            team_enemies = filter(lambda x: x is not None, [self.select_enemy(t, world) for t in world.troopers
-                                                            if t.teammate and t.id != me.id])
+            team_enemies = filter(lambda x: x is not None, [self.select_enemy(t, world) for t in
+                                                            world_index_for(world).teammates if t.id != me.id])
             if len(team_enemies) > 0:
                 log_it('medic going to team-rear position')
                 position = self.select_position_for_medic(me, world)
@@ -775,23 +764,60 @@ class MyStrategy:
                 log_it('stend up and move')
                 return self._stand_up_or_move(world, move, game, me, path[0])
 
+    @staticmethod
+    def _plan_attack(move, me, world, game):
+        """
+        Планируем ход целиком (см. TurnPlanner) и делаем первое действие плана, если план наносит урон
+        Иначе оставляем решение жадным правилам
+
+        """
+
+        if not PLAN_time_budget and not PLAN_node_limit:
+            return False
+
+        # планировщик укладываем в остаток бюджета хода
+        time_budget = deadline_for(world).remaining() - MOVE_time_reserve
+        if PLAN_time_budget:
+            time_budget = min(PLAN_time_budget, time_budget)
+        if time_budget <= 0:
+            return False
+
+        planner = TurnPlanner(me, world, game, time_budget, CF_plan_exposure, PLAN_node_limit or None)
+        steps = planner.plan()
+        log_it('turn plan %s (value %s, damage %s, depth %s, nodes %s)' % (str(steps), str(planner.value),
+                                                                           str(planner.damage),
+                                                                           str(planner.completed_depth),
+                                                                           str(planner.node_count)), 'debug')
+
+        if not steps or planner.damage <= 0:
+            return False
+
+        move.action, x, y = steps[0]
+        if x >= 0:
+            move.x = x
+            move.y = y
+        return True
+
     def _attack_unit(self, world, me, move, game, enemy):
         log_it('attack enemy id %s (hits %s)' % (str(enemy.id), str(enemy.hitpoints)))
+        if self._plan_attack(move, me, world, game):
+            return
+
         lower_stance = TrooperStance.KNEELING if me.stance == TrooperStance.STANDING else TrooperStance.PRONE
         upper_stance = TrooperStance.KNEELING if me.stance == TrooperStance.PRONE else TrooperStance.STANDING
+        engagement = engagement_for(world)
 
-        if world.is_visible(me.shooting_range, me.x, me.y, me.stance, enemy.x, enemy.y, enemy.stance):
+        if engagement.can_shoot(me, enemy, me.stance):
             log_it('attack unit')
             if self.could_and_need_use_ration(me, game):
                 return self._eat_ration(move, me, game)
-            elif self.could_and_need_use_grenade(me, enemy, game, world):
-                return self._shoot_grenade(move, me, enemy, game)
-            elif world.is_visible(me.shooting_range, me.x, me.y, lower_stance, enemy.x, enemy.y, enemy.stance):
-                return self._lower_stance_or_shoot(move, me, enemy, game)
+            elif self._throw_grenade_if_useful(move, me, game, world):
+                return
+            elif engagement.can_shoot(me, enemy, lower_stance):
+                return self._lower_stance_or_shoot(world, move, me, enemy, game)
             else:
                 return self._shoot(move, me, enemy)
-        elif upper_stance != me.stance and world.is_visible(me.shooting_range, me.x, me.y, TrooperStance.STANDING,
-                                                            enemy.x, enemy.y, enemy.stance):
+        elif upper_stance != me.stance and engagement.can_shoot(me, enemy, TrooperStance.STANDING):
             log_it('raise stance for attack')
             return self._stand_up(move, me, game)
         else:
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import SharedVars as shared
+from model.CellType import CellType
+
+
+class PassabilityGrid:
+    """
+    Статическая карта проходимости: плоский bytearray по клеткам (индекс x * height + y)
+    и заранее посчитанные таблицы соседей для 4- и 8-связности
+
+    Соседи перечислены в том же порядке, что и раньше перебирались клетки вокруг (сначала по осям, потом
+    по диагоналям), и только в пределах поля. Бойцы на карту не наносятся: для этого есть overlay_for,
+    копия карты на снимок мира с занятыми клетками.
+
+    """
+
+    def __init__(self, cells):
+        self.cells = cells
+        self.width = len(cells)
+        self.height = len(cells[0]) if cells else 0
+        self.cell_count = self.width * self.height
+
+        self.passable = bytearray(1 if v == CellType.FREE else 0 for column in cells for v in column)
+
+        self.neighbours = []
+        self.neighbours_diagonal = []
+
+        width = self.width
+        height = self.height
+
+        for x in xrange(width):
+            left = x > 0
+            right = x < width - 1
+
+            for y in xrange(height):
+                i = x * height + y
+                down = y > 0
+                up = y < height - 1
+
+                # (x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)
+                axial = [c for c, inside in ((i - height, left), (i + height, right), (i - 1, down), (i + 1, up))
+                         if inside]
+                # (x + 1, y + 1), (x - 1, y + 1), (x + 1, y - 1), (x - 1, y - 1)
+                diagonal = [c for c, inside in ((i + height + 1, right and up), (i - height + 1, left and up),
+                                                (i + height - 1, right and down), (i - height - 1, left and down))
+                            if inside]
+
+                self.neighbours.append(tuple(axial))
+                self.neighbours_diagonal.append(tuple(axial + diagonal))
+
+    def contains(self, coord):
+        return 0 <= coord[0] < self.width and 0 <= coord[1] < self.height
+
+    def index(self, x, y):
+        return x * self.height + y
+
+    def coord(self, index):
+        return index / self.height, index % self.height
+
+    def free_neighbours(self, coord, allow_diagonaly=False, passable=None):
+        """
+        Проходимые соседние клетки (координатами); passable - своя карта проходимости вместо статической
+
+        """
+
+        if passable is None:
+            passable = self.passable
+
+        neighbours = self.neighbours_diagonal if allow_diagonaly else self.neighbours
+        return [self.coord(i) for i in neighbours[self.index(*coord)] if passable[i]]
+
+    def overlay_for(self, world):
+        """
+        Карта проходимости снимка мира: статическая, плюс клетки, занятые бойцами, непроходимы
+
+        """
+
+        overlay = getattr(world, "passability_overlay", None)
+
+        if overlay is None:
+            overlay = bytearray(self.passable)
+            for t in world.troopers:
+                overlay[self.index(t.x, t.y)] = 0
+            world.passability_overlay = overlay
+
+        return overlay
+
+
+def passability_grid_for(world):
+    """
+    Карта проходимости текущей игры, строится один раз на карту
+
+    """
+
+    grid = shared.passability_grid
+
+    if grid is None or (grid.cells is not world.cells and grid.cells != world.cells):
+        grid = shared.passability_grid = PassabilityGrid(world.cells)
+
+    return grid
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+
+import SharedVars as shared
+from PassabilityGrid import passability_grid_for
+
+
+class CachedPath:
+    """
+    Закешированный путь: цепочка клеток от начала (включая) до цели, позиции клеток в ней
+    и набор перекрытых клеток, при которых путь кратчайший (None - путь не обязательно кратчайший)
+
+    """
+
+    def __init__(self, chain, shortest_for, used_at):
+        self.chain = chain
+        self.positions = dict((coord, index) for index, coord in enumerate(chain))
+        self.shortest_for = shortest_for
+        self.used_at = used_at
+
+
+class PathCache:
+    """
+    Общий для команды LRU-кеш путей по ключу (откуда, куда, отпечаток препятствий)
+
+    Отпечаток препятствий - занятые бойцами соседние с началом пути клетки, только они и перекрываются
+    при поиске. Кроме точного совпадения ключа, путь отдаётся как кусок закешированного пути, на котором лежат
+    обе точки (в любом направлении): кусок кратчайшего пути сам кратчайший. Поэтому куски берём только из путей,
+    найденных точно (поле расстояний, BFS / A* / JPS, D* Lite), а не иерархическим поиском, и только если
+    путь кратчайший при части перекрытий запроса (shortest_for) и не идёт через остальные. Пути проиндексированы
+    по клеткам, так что кандидаты на кусок - пересечение путей через обе точки.
+    Счётчики hits / sub_path_hits / misses / evictions показывают, как работает кеш.
+
+    """
+
+    CAPACITY = 128
+
+    def __init__(self, grid, capacity=CAPACITY):
+        self.grid = grid
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.keys_by_cell = {}
+        self.clock = 0
+
+        self.hits = 0
+        self.sub_path_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _touch(self, key):
+        entry = self.entries.pop(key)
+        self.entries[key] = entry
+
+        self.clock += 1
+        entry.used_at = self.clock
+        return entry
+
+    def get(self, coord_from, coord_to, blocked):
+        """
+        Путь из coord_from (не включая) в coord_to (включая), None - если в кеше его нет
+
+        """
+
+        key = (coord_from, coord_to, blocked)
+
+        if key in self.entries:
+            self.hits += 1
+            return self._touch(key).chain[1:]
+
+        keys = self.keys_by_cell.get(coord_from)
+        other_keys = self.keys_by_cell.get(coord_to)
+        if keys and other_keys:
+            blocked_cells = frozenset(blocked)
+            candidates = [(self.entries[key], key) for key in keys & other_keys]
+
+            for entry, key in sorted(candidates, key=lambda candidate: -candidate[0].used_at):
+                if entry.shortest_for is None or not entry.shortest_for <= blocked_cells:
+                    continue
+
+                start_index = entry.positions[coord_from]
+                end_index = entry.positions[coord_to]
+
+                if start_index < end_index:
+                    path = entry.chain[start_index + 1:end_index + 1]
+                else:
+                    path = entry.chain[end_index:start_index][::-1]
+
+                if blocked_cells.intersection(path):
+                    continue
+
+                self._touch(key)
+                self.sub_path_hits += 1
+                return path
+
+        self.misses += 1
+        return None
+
+    def put(self, coord_from, coord_to, blocked, path, shortest_for=None):
+        """
+        shortest_for - перекрытые клетки, при которых path кратчайший (пустой набор - кратчайший по всей карте),
+        None - путь найден приближённо и годится только для точного совпадения ключа
+
+        """
+
+        key = (coord_from, coord_to, blocked)
+        self._remove(key)
+
+        self.clock += 1
+        entry = CachedPath([coord_from] + path, None if shortest_for is None else frozenset(shortest_for),
+                           self.clock)
+        self.entries[key] = entry
+        for coord in entry.positions:
+            self.keys_by_cell.setdefault(coord, set()).add(key)
+
+        while len(self.entries) > self.capacity:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+
+        for coord in entry.positions:
+            keys = self.keys_by_cell[coord]
+            keys.discard(key)
+            if not keys:
+                del self.keys_by_cell[coord]
+
+        return True
+
+    def evict(self, coord):
+        """
+        Выкидываем все пути через клетку coord (например, если на ней неожиданно оказался боец)
+
+        """
+
+        keys = list(self.keys_by_cell.get(coord, ()))
+
+        for key in keys:
+            self._remove(key)
+
+        self.evictions += len(keys)
+        return len(keys)
+
+    def clear(self):
+        self.evictions += len(self.entries)
+        self.entries.clear()
+        self.keys_by_cell.clear()
+
+    def stats(self):
+        return with_hit_rates(dict(size=len(self.entries), hits=self.hits, sub_path_hits=self.sub_path_hits,
+                                   misses=self.misses, evictions=self.evictions))
+
+
+def with_hit_rates(stats):
+    """
+    Счётчики кеша с долями точных попаданий и попаданий кусками пути среди всех запросов
+
+    """
+
+    request_count = stats["hits"] + stats["sub_path_hits"] + stats["misses"]
+    stats["hit_rate"] = round(float(stats["hits"]) / request_count, 3) if request_count else None
+    stats["sub_path_hit_rate"] = round(float(stats["sub_path_hits"]) / request_count, 3) if request_count else None
+    return stats
+
+
+def combined_stats(stats_list):
+    """
+    Сумма счётчиков нескольких кешей (например, всех игроков всех игр арены)
+
+    """
+
+    names = ("hits", "sub_path_hits", "misses", "evictions")
+    return with_hit_rates(dict((name, sum(stats[name] for stats in stats_list)) for name in names))
+
+
+def path_cache_for(world):
+    grid = passability_grid_for(world)
+
+    if shared.path_cache is None or shared.path_cache.grid is not grid:
+        shared.path_cache = PathCache(grid)
+
+    return shared.path_cache
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import random
+from collections import deque
+
+
+class PathFinder:
+    """
+    Поиск кратчайшего пути по плоской карте проходимости (PassabilityGrid), 4-связность, шаг равной цены
+
+    BFS идёт очередью и останавливается, как только дошёл до финиша. A* берёт манхэттенское расстояние
+    как допустимую эвристику и раскрывает заметно меньше клеток на открытой карте.
+    Путь восстанавливается от финиша по соседям с номером волны на единицу меньше. Если таких несколько,
+    выбираем случайно: через random.shuffle, как раньше, или детерминированно по tie_break_seed
+    (один и тот же запрос на той же карте всегда даёт тот же путь).
+    Jump Point Search (use_jps) - A* по точкам прыжка вдоль прямых, для больших открытых карт;
+    путь тоже кратчайший, но выбирается без случайности.
+
+    """
+
+    def __init__(self, grid, use_astar=False, tie_break_seed=None, use_jps=False):
+        self.grid = grid
+        self.use_astar = use_astar
+        self.tie_break_seed = tie_break_seed
+        self.use_jps = use_jps
+
+    def find_path(self, passable, start, finish):
+        """
+        Путь индексами клеток от start (не включая) до finish (включая), None - если до финиша не дойти
+
+        """
+
+        if not passable[finish]:
+            return None
+
+        if self.use_jps:
+            return self.jump_point_search(passable, start, finish)
+
+        if self.use_astar:
+            wave_nums = self.astar(passable, start, finish)
+        else:
+            wave_nums = self.bfs(passable, start, finish)
+
+        if wave_nums[finish] is None:
+            return None
+
+        shuffle = self.tie_break_shuffle(start, finish)
+        neighbours = self.grid.neighbours
+
+        path = [finish]
+        while True:
+            current_cell = path[-1]
+            cells = [i for i in neighbours[current_cell] if wave_nums[i] == wave_nums[current_cell] - 1]
+            shuffle(cells)
+
+            new_cell = cells.pop()
+            if wave_nums[new_cell] > 0:
+                path.append(new_cell)
+            else:
+                break
+
+        path.reverse()
+        return path
+
+    def batch(self, passable, pairs):
+        """
+        Расстояния и первые шаги сразу для многих пар (start, finish): {(start, finish): (distance, first_step)}
+        Для недостижимых пар - None
+
+        Пары группируются по стороне с меньшим числом разных клеток: один BFS от каждого старта до всех его
+        финишей (с остановкой, когда все найдены) или один обратный BFS от каждого финиша до всех его стартов.
+        Первый шаг детерминирован - первый подходящий сосед в порядке таблицы соседей.
+
+        """
+
+        by_start = {}
+        by_finish = {}
+        for start, finish in pairs:
+            by_start.setdefault(start, set()).add(finish)
+            by_finish.setdefault(finish, set()).add(start)
+
+        out = {}
+
+        if len(by_start) <= len(by_finish):
+            for start, finishes in by_start.iteritems():
+                wave_nums, first_steps = self._multi_target_bfs(passable, start, finishes)
+                for finish in finishes:
+                    if finish == start:
+                        out[(start, finish)] = (0, None)
+                    elif wave_nums[finish] is None:
+                        out[(start, finish)] = None
+                    else:
+                        out[(start, finish)] = (wave_nums[finish], first_steps[finish])
+        else:
+            neighbours = self.grid.neighbours
+            for finish, starts in by_finish.iteritems():
+                wave_nums, first_steps = self._multi_target_bfs(passable, finish, starts)
+                for start in starts:
+                    if finish == start:
+                        out[(start, finish)] = (0, None)
+                    elif wave_nums[start] is None:
+                        out[(start, finish)] = None
+                    else:
+                        first_step = [i for i in neighbours[start] if wave_nums[i] == wave_nums[start] - 1 and
+                                      (passable[i] or i == finish)][0]
+                        out[(start, finish)] = (wave_nums[start], first_step)
+
+        return out
+
+    def _multi_target_bfs(self, passable, source, targets):
+        """
+        BFS от source до всех targets (сами targets и source могут быть непроходимы - например, заняты бойцами)
+        Для каждой достигнутой клетки запоминаем и первый шаг от source к ней
+
+        """
+
+        neighbours = self.grid.neighbours
+
+        wave_nums = [None] * self.grid.cell_count
+        first_steps = [None] * self.grid.cell_count
+        wave_nums[source] = 0
+        queue = deque([source])
+        remaining = len(set(targets) - set([source]))
+
+        while queue and remaining:
+            cell = queue.popleft()
+            wave_num = wave_nums[cell] + 1
+
+            for i in neighbours[cell]:
+                if wave_nums[i] is not None:
+                    continue
+
+                if i in targets:
+                    remaining -= 1
+                elif not passable[i]:
+                    continue
+
+                wave_nums[i] = wave_num
+                first_steps[i] = i if cell == source else first_steps[cell]
+                if passable[i]:
+                    queue.append(i)
+
+        return wave_nums, first_steps
+
+    def tie_break_shuffle(self, start, finish):
+        if self.tie_break_seed is None:
+            return random.shuffle
+
+        return random.Random(hash((self.tie_break_seed, start, finish))).shuffle
+
+    def bfs(self, passable, start, finish):
+        neighbours = self.grid.neighbours
+
+        wave_nums = [None] * self.grid.cell_count
+        wave_nums[start] = 0
+        queue = deque([start])
+
+        while queue:
+            cell = queue.popleft()
+            wave_num = wave_nums[cell] + 1
+
+            for i in neighbours[cell]:
+                if passable[i] and wave_nums[i] is None:
+                    wave_nums[i] = wave_num
+                    if i == finish:
+                        return wave_nums
+                    queue.append(i)
+
+        return wave_nums
+
+    def astar(self, passable, start, finish):
+        """
+        Номера волн только у раскрытых клеток - для них они точные, этого хватает для восстановления пути
+
+        """
+
+        neighbours = self.grid.neighbours
+        height = self.grid.height
+        finish_x, finish_y = divmod(finish, height)
+
+        distances = [None] * self.grid.cell_count
+        distances[start] = 0
+        wave_nums = [None] * self.grid.cell_count
+
+        start_x, start_y = divmod(start, height)
+        # при равной оценке раскрываем более дальнюю от старта клетку: на открытой карте идём прямо к финишу
+        queue = [(abs(finish_x - start_x) + abs(finish_y - start_y), 0, start)]
+
+        while queue:
+            estimate, distance, cell = heapq.heappop(queue)
+            if wave_nums[cell] is not None:
+                continue
+
+            distance = -distance
+            wave_nums[cell] = distance
+            if cell == finish:
+                break
+
+            distance += 1
+            for i in neighbours[cell]:
+                if passable[i] and wave_nums[i] is None and (distances[i] is None or distance < distances[i]):
+                    distances[i] = distance
+                    x, y = divmod(i, height)
+                    heapq.heappush(queue, (distance + abs(finish_x - x) + abs(finish_y - y), -distance, i))
+
+        return wave_nums
+
+    def jump_point_search(self, passable, start, finish):
+        """
+        JPS для 4-связной сетки: от точки прыжка идём по прямой, пока не встретим финиш или клетку
+        с вынужденным соседом; при движении по вертикали проверяем ещё и горизонтальные прыжки
+
+        """
+
+        height = self.grid.height
+        finish_x, finish_y = divmod(finish, height)
+
+        distances = {start: 0}
+        parents = {}
+        closed = set()
+
+        start_x, start_y = divmod(start, height)
+        queue = [(abs(finish_x - start_x) + abs(finish_y - start_y), 0, start)]
+
+        while queue:
+            estimate, distance, cell = heapq.heappop(queue)
+            if cell in closed:
+                continue
+
+            closed.add(cell)
+            if cell == finish:
+                break
+
+            x, y = divmod(cell, height)
+            for dx, dy in self._jump_directions(passable, cell, parents.get(cell)):
+                jump_point = self._jump(passable, x + dx, y + dy, dx, dy, finish)
+                if jump_point is None or jump_point in closed:
+                    continue
+
+                jump_x, jump_y = divmod(jump_point, height)
+                jump_distance = distance + abs(jump_x - x) + abs(jump_y - y)
+                if jump_distance < distances.get(jump_point, jump_distance + 1):
+                    distances[jump_point] = jump_distance
+                    parents[jump_point] = cell
+                    heapq.heappush(queue, (jump_distance + abs(finish_x - jump_x) + abs(finish_y - jump_y),
+                                           jump_distance, jump_point))
+
+        if finish not in closed:
+            return None
+
+        # разворачиваем прямые отрезки между точками прыжка
+        path = []
+        cell = finish
+        while cell != start:
+            parent = parents[cell]
+            x, y = divmod(cell, height)
+            parent_x, parent_y = divmod(parent, height)
+            dx = cmp(x, parent_x)
+            dy = cmp(y, parent_y)
+
+            while (x, y) != (parent_x, parent_y):
+                path.append(x * height + y)
+                x -= dx
+                y -= dy
+
+            cell = parent
+
+        path.reverse()
+        return path
+
+    def _walkable(self, passable, x, y):
+        return 0 <= x < self.grid.width and 0 <= y < self.grid.height and passable[x * self.grid.height + y]
+
+    def _jump_directions(self, passable, cell, parent):
+        height = self.grid.height
+        x, y = divmod(cell, height)
+
+        if parent is None:
+            return [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+        parent_x, parent_y = divmod(parent, height)
+        dx = cmp(x, parent_x)
+        dy = cmp(y, parent_y)
+
+        if dx:
+            directions = [(0, -1), (0, 1), (dx, 0)]
+        else:
+            directions = [(-1, 0), (1, 0), (0, dy)]
+
+        return [(ddx, ddy) for ddx, ddy in directions if self._walkable(passable, x + ddx, y + ddy)]
+
+    def _jump(self, passable, x, y, dx, dy, finish):
+        walkable = self._walkable
+        height = self.grid.height
+
+        while True:
+            if not walkable(passable, x, y):
+                return None
+
+            cell = x * height + y
+            if cell == finish:
+                return cell
+
+            if dx:
+                if (walkable(passable, x, y - 1) and not walkable(passable, x - dx, y - 1)) or \
+                   (walkable(passable, x, y + 1) and not walkable(passable, x - dx, y + 1)):
+                    return cell
+            else:
+                if (walkable(passable, x - 1, y) and not walkable(passable, x - 1, y - dy)) or \
+                   (walkable(passable, x + 1, y) and not walkable(passable, x + 1, y - dy)):
+                    return cell
+
+                if self._jump(passable, x + 1, y, 1, 0, finish) is not None or \
+                   self._jump(passable, x - 1, y, -1, 0, finish) is not None:
+                    return cell
+
+            x += dx
+            y += dy
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import socket
+import struct
+import sys
+import threading
+import time
+
+from RemoteProcessClient import RemoteProcessClient
+from RemoteProcessCodec import MOVE_CODEC
+from ReplayClient import ReplayClient
+from model.Move import Move
+
+
+class ReplayServer:
+    """
+    Подставной local-runner на loopback: отдаёт входящий поток записи (StreamRecorder) по одному сообщению
+    и на сообщения, требующие ответа, ждёт ответ клиента, как настоящий раннер
+
+    """
+
+    def __init__(self, path):
+        replay_client = ReplayClient(path)
+        stream = replay_client.socket
+
+        self.data = stream.data
+        entries = sorted(stream.index)
+        ends = [offset for offset, message_type, move_index in entries[1:]] + \
+               [stream.stream_end - stream.stream_start]
+        self.messages = [(stream.stream_start + offset, stream.stream_start + end, message_type)
+                         for (offset, message_type, move_index), end in zip(entries, ends)]
+
+        self.server_socket = socket.socket()
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind(("127.0.0.1", 0))
+        self.server_socket.listen(1)
+        self.port = self.server_socket.getsockname()[1]
+
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        connection, address = self.server_socket.accept()
+
+        try:
+            # токен: тип, длина строки, строка
+            self.read_exact(connection, 1)
+            self.read_exact(connection, struct.unpack("<i", self.read_exact(connection, 4))[0])
+
+            for start, end, message_type in self.messages:
+                connection.sendall(self.data[start:end])
+
+                if message_type == RemoteProcessClient.MessageType.TEAM_SIZE:
+                    self.read_exact(connection, 5)
+                elif message_type == RemoteProcessClient.MessageType.PLAYER_CONTEXT:
+                    if self.read_exact(connection, 2)[1] != "\0":
+                        self.read_exact(connection, MOVE_CODEC.struct.size)
+        finally:
+            connection.close()
+            self.server_socket.close()
+
+    @staticmethod
+    def read_exact(connection, byte_count):
+        data = ""
+
+        while len(data) < byte_count:
+            chunk = connection.recv(byte_count - len(data))
+            if not chunk:
+                raise IOError("Can't read %s bytes from client." % str(byte_count))
+            data += chunk
+
+        return data
+
+
+class UnbufferedClient(RemoteProcessClient):
+    """
+    Клиент в старом режиме записи для сравнения: каждое поле уходит отдельным send, алгоритм Нейгла включён
+
+    """
+
+    def __init__(self, host, port):
+        RemoteProcessClient.__init__(self, host, port)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 0)
+
+    def write_bytes(self, byte_array):
+        self.socket.sendall(byte_array)
+
+
+def round_trip_benchmark(path, client_class=RemoteProcessClient):
+    """
+    Игра из записи через loopback с пустыми ходами: время на всю игру и на ход (сообщение мира и ответ),
+    без затрат стратегии
+
+    """
+
+    server = ReplayServer(path)
+    client = client_class("127.0.0.1", server.port)
+
+    try:
+        started_at = time.time()
+        move_count = 0
+
+        client.write_token("0000000000000000")
+        client.read_team_size()
+        client.write_protocol_version()
+        client.read_game_context()
+
+        while client.read_player_context() is not None:
+            client.write_move(Move())
+            move_count += 1
+
+        elapsed = time.time() - started_at
+    finally:
+        client.close()
+        server.thread.join()
+
+    return dict(moves=move_count, seconds=round(elapsed, 3),
+                ms_per_move=round(elapsed / move_count * 1000, 3) if move_count else None)
+
+
+def decode_benchmark(path, repeat_count=5):
+    """
+    Разбор всех сообщений записи без сети: лучшее из repeat_count время и время на мир
+
+    """
+
+    best = None
+    world_count = 0
+
+    for repeat_index in xrange(repeat_count):
+        client = ReplayClient(path)
+
+        try:
+            started_at = time.time()
+            world_count = 0
+
+            client.read_team_size()
+            client.read_game_context()
+            while client.read_player_context() is not None:
+                world_count += 1
+
+            elapsed = time.time() - started_at
+        finally:
+            client.close()
+
+        best = elapsed if best is None else min(best, elapsed)
+
+    return dict(worlds=world_count, seconds=round(best, 4),
+                ms_per_world=round(best / world_count * 1000, 4) if world_count else None)
+
+
+if __name__ == "__main__":
+    if 2 <= len(sys.argv) <= 3:
+        logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s', level=logging.INFO)
+
+        recording_path = sys.argv[1]
+        repeat_count = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+        logging.info("protocol benchmark %s" % json.dumps(dict(
+            decode=decode_benchmark(recording_path, repeat_count),
+            round_trip=round_trip_benchmark(recording_path),
+            round_trip_unbuffered=round_trip_benchmark(recording_path, UnbufferedClient),
+        ), sort_keys=True))
+    else:
+        sys.stderr.write("usage: ProtocolBenchmark.py <recording> [<repeat count>]\n")
+        sys.exit(1)
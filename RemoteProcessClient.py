@@ -1,15 +1,15 @@
+import hashlib
+import mmap
+import os
 import socket
 import struct
-from model.Bonus import Bonus
-from model.BonusType import BonusType
+from CompactVisibility import CompactVisibility
+from StreamRecorder import StreamRecorder
+from TrooperTable import TrooperTable
+from RemoteProcessCodec import BONUS_CODEC, GAME_CODEC, MOVE_CODEC, PLAYER_CODEC, TROOPER_CODEC, WORLD_CODEC, \
+    enum_table
 from model.CellType import CellType
-from model.Game import Game
-from model.Player import Player
 from model.PlayerContext import PlayerContext
-from model.Trooper import Trooper
-from model.TrooperStance import TrooperStance
-from model.TrooperType import TrooperType
-from model.World import World
 
 
 class RemoteProcessClient:
@@ -22,54 +22,89 @@ class RemoteProcessClient:
     LONG_SIZE_BYTES = 8
     DOUBLE_SIZE_BYTES = 8
 
-    def __init__(self, host, port):
-        self.socket = socket.socket()
-        self.socket.connect((host, port))
+    READ_BUFFER_SIZE_BYTES = 1 << 16
+
+    SIGNED_BYTE_STRUCT = struct.Struct(BYTE_ORDER_FORMAT_STRING + "b")
+    INTEGER_STRUCT = struct.Struct(BYTE_ORDER_FORMAT_STRING + "i")
+    LONG_STRUCT = struct.Struct(BYTE_ORDER_FORMAT_STRING + "q")
+    DOUBLE_STRUCT = struct.Struct(BYTE_ORDER_FORMAT_STRING + "d")
+
+    CELL_TYPE_TABLE = enum_table(CellType)
+
+    CELL_VISIBILITIES_CACHE_FILE_EXTENSION = ".visibilities"
+
+    def __init__(self, host, port, cell_visibilities_cache_dir=None, record_path=None,
+                 compact_cell_visibilities=False, trooper_tables=False):
+        socket_ = socket.socket()
+        socket_.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        socket_.connect((host, port))
+
+        if record_path is not None:
+            socket_ = StreamRecorder(socket_, record_path)
+
+        self.init_state(socket_, cell_visibilities_cache_dir, compact_cell_visibilities, trooper_tables)
+        self.recorder = socket_ if record_path is not None else None
+
+    def init_state(self, socket_, cell_visibilities_cache_dir=None, compact_cell_visibilities=False,
+                   trooper_tables=False):
+        self.socket = socket_
+        self.recorder = None
         self.cells = None
         self.cell_visibilities = None
+        self.cell_visibilities_cache_dir = cell_visibilities_cache_dir
+        self.compact_cell_visibilities = compact_cell_visibilities
+        self.trooper_tables = trooper_tables
+
+        self.read_buffer = bytearray(RemoteProcessClient.READ_BUFFER_SIZE_BYTES)
+        self.read_buffer_view = memoryview(self.read_buffer)
+        self.read_buffer_offset = 0
+        self.read_buffer_length = 0
+
+        self.write_buffer = bytearray()
 
     def write_token(self, token):
         self.write_enum(RemoteProcessClient.MessageType.AUTHENTICATION_TOKEN)
         self.write_string(token)
+        self.flush()
 
     def read_team_size(self):
+        message_offset = self.stream_offset()
         message_type = self.read_enum(RemoteProcessClient.MessageType)
         self.ensure_message_type(message_type, RemoteProcessClient.MessageType.TEAM_SIZE)
-        return self.read_int()
+        team_size = self.read_int()
+
+        self.record_message(message_offset, message_type)
+        return team_size
 
     def write_protocol_version(self):
         self.write_enum(RemoteProcessClient.MessageType.PROTOCOL_VERSION)
         self.write_int(2)
+        self.flush()
 
     def read_game_context(self):
+        message_offset = self.stream_offset()
         message_type = self.read_enum(RemoteProcessClient.MessageType)
         self.ensure_message_type(message_type, RemoteProcessClient.MessageType.GAME_CONTEXT)
-        if not self.read_boolean():
-            return None
+        game = GAME_CODEC.read(self) if self.read_boolean() else None
 
-        return Game(
-            self.read_int(),
-            self.read_int(), self.read_int(),
-            self.read_int(), self.read_double(),
-            self.read_int(), self.read_int(), self.read_int(), self.read_int(),
-            self.read_int(), self.read_double(),
-            self.read_int(), self.read_int(),
-            self.read_int(), self.read_int(), self.read_int(),
-            self.read_double(), self.read_double(), self.read_double(),
-            self.read_double(), self.read_double(),
-            self.read_double(), self.read_double(),
-            self.read_int(), self.read_double(), self.read_int(), self.read_int(),
-            self.read_int(), self.read_int(), self.read_int(),
-            self.read_int(), self.read_int()
-        )
+        self.record_message(message_offset, message_type)
+        return game
 
     def read_player_context(self):
+        message_offset = self.stream_offset()
         message_type = self.read_enum(RemoteProcessClient.MessageType)
         if message_type == RemoteProcessClient.MessageType.GAME_OVER:
+            self.record_message(message_offset, message_type)
             return None
 
         self.ensure_message_type(message_type, RemoteProcessClient.MessageType.PLAYER_CONTEXT)
-        return PlayerContext(self.read_trooper(), self.read_world()) if self.read_boolean() else None
+        player_context = PlayerContext(self.read_trooper(), self.read_world()) if self.read_boolean() else None
+
+        self.record_message(
+            message_offset, message_type,
+            -1 if player_context is None or player_context.world is None else player_context.world.move_index
+        )
+        return player_context
 
     def write_move(self, move):
         self.write_enum(RemoteProcessClient.MessageType.MOVE)
@@ -78,85 +113,79 @@ class RemoteProcessClient:
             self.write_boolean(False)
         else:
             self.write_boolean(True)
+            self.write_bytes(MOVE_CODEC.pack(move))
 
-            self.write_enum(move.action)
-            self.write_enum(move.direction)
-            self.write_int(move.x)
-            self.write_int(move.y)
+        self.flush()
 
     def close(self):
         self.socket.close()
 
+    def fileno(self):
+        return self.socket.fileno()
+
+    def stream_offset(self):
+        if self.recorder is None:
+            return -1
+
+        return self.recorder.received_byte_count - (self.read_buffer_length - self.read_buffer_offset)
+
+    def record_message(self, message_offset, message_type, move_index=-1):
+        if self.recorder is not None:
+            self.recorder.add_index_entry(message_offset, message_type, move_index)
+
     def read_world(self):
         if not self.read_boolean():
             return None
 
-        return World(
-            self.read_int(), self.read_int(), self.read_int(), self.read_players(),
-            self.read_troopers(), self.read_bonuses(), self.read_cells(), self.read_cell_visibilities()
-        )
+        return WORLD_CODEC.read(self)
 
     def read_players(self):
-        player_count = self.read_int()
-        if player_count < 0:
-            return None
+        return self.read_records(PLAYER_CODEC)
 
-        players = []
-
-        for player_index in xrange(player_count):
-            if self.read_boolean():
-                player = Player(
-                    self.read_long(), self.read_string(), self.read_int(), self.read_boolean(),
-                    self.read_int(), self.read_int()
-                )
-                players.append(player)
-            else:
-                players.append(None)
+    def read_troopers(self):
+        if self.trooper_tables:
+            return self.read_trooper_table()
 
-        return players
+        return self.read_records(TROOPER_CODEC)
 
-    def read_troopers(self):
+    def read_trooper_table(self):
         trooper_count = self.read_int()
         if trooper_count < 0:
             return None
 
-        troopers = []
+        table = TrooperTable()
 
         for trooper_index in xrange(trooper_count):
-            troopers.append(self.read_trooper())
+            if self.read_boolean():
+                table.append_values(self.read_struct(TROOPER_CODEC.struct))
+            else:
+                table.append_none()
 
-        return troopers
+        return table
 
     def read_trooper(self):
-        if not self.read_boolean():
-            return None
-
-        return Trooper(
-            self.read_long(), self.read_int(), self.read_int(), self.read_long(),
-            self.read_int(), self.read_boolean(), self.read_enum(TrooperType), self.read_enum(TrooperStance),
-            self.read_int(), self.read_int(), self.read_int(), self.read_int(),
-            self.read_double(), self.read_double(), self.read_int(),
-            self.read_int(), self.read_int(), self.read_int(), self.read_int(),
-            self.read_boolean(), self.read_boolean(), self.read_boolean()
-        )
+        return self.read_record(TROOPER_CODEC)
 
     def read_bonuses(self):
-        bonus_count = self.read_int()
-        if bonus_count < 0:
+        return self.read_records(BONUS_CODEC)
+
+    def read_records(self, codec):
+        record_count = self.read_int()
+        if record_count < 0:
             return None
 
-        bonuses = []
+        records = []
 
-        for bonus_index in xrange(bonus_count):
-            if self.read_boolean():
-                bonus = Bonus(
-                    self.read_long(), self.read_int(), self.read_int(), self.read_enum(BonusType)
-                )
-                bonuses.append(bonus)
-            else:
-                bonuses.append(None)
+        for record_index in xrange(record_count):
+            records.append(self.read_record(codec))
+
+        return records
 
-        return bonuses
+    def read_record(self, codec):
+        if not self.read_boolean():
+            return None
+
+        return codec.read(self)
 
     def read_cells(self):
         if self.cells is not None:
@@ -174,10 +203,7 @@ class RemoteProcessClient:
                 self.cells.append(None)
                 continue
 
-            self.cells.append([])
-
-            for y in xrange(height):
-                self.cells[x].append(self.read_enum(CellType))
+            self.cells.append(map(RemoteProcessClient.CELL_TYPE_TABLE.__getitem__, self.read_signed_byte_array(height)))
 
         return self.cells
 
@@ -197,7 +223,45 @@ class RemoteProcessClient:
         if stance_count < 0:
             return None
 
-        self.cell_visibilities = self.read_bytes(world_width * world_height * world_width * world_height * stance_count)
+        byte_count = world_width * world_height * world_width * world_height * stance_count
+
+        if self.compact_cell_visibilities:
+            self.cell_visibilities = CompactVisibility(world_width, world_height, stance_count)
+
+            row = bytearray(world_width * world_height * stance_count)
+            row_view = memoryview(row)
+
+            for cell_index in xrange(world_width * world_height):
+                self.read_bytes_into(row_view)
+                self.cell_visibilities.add_row(cell_index, row)
+
+            return self.cell_visibilities
+
+        if self.cell_visibilities_cache_dir is None:
+            self.cell_visibilities = buffer(self.read_bytearray(byte_count))
+            return self.cell_visibilities
+
+        cache_file_path = os.path.join(
+            self.cell_visibilities_cache_dir,
+            hashlib.md5(repr((world_width, world_height, stance_count, self.cells))).hexdigest()
+            + RemoteProcessClient.CELL_VISIBILITIES_CACHE_FILE_EXTENSION
+        )
+
+        if os.path.isfile(cache_file_path) and os.path.getsize(cache_file_path) == byte_count:
+            self.skip_bytes(byte_count)
+        else:
+            byte_array = self.read_bytearray(byte_count)
+
+            if not os.path.isdir(self.cell_visibilities_cache_dir):
+                os.makedirs(self.cell_visibilities_cache_dir)
+
+            temporary_file_path = "%s.%d.tmp" % (cache_file_path, os.getpid())
+            with open(temporary_file_path, "wb") as cache_file:
+                cache_file.write(byte_array)
+            os.rename(temporary_file_path, cache_file_path)
+
+        with open(cache_file_path, "rb") as cache_file:
+            self.cell_visibilities = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
 
         return self.cell_visibilities
 
@@ -206,17 +270,10 @@ class RemoteProcessClient:
             raise ValueError("Received wrong message [actual=%s, expected=%s]." % (actual_type, expected_type))
 
     def read_enum(self, enum_class):
-        byte_array = self.read_bytes(RemoteProcessClient.SIGNED_BYTE_SIZE_BYTES)
-        value = struct.unpack(RemoteProcessClient.BYTE_ORDER_FORMAT_STRING + "b", byte_array)[0]
-
-        for enum_key, enum_value in enum_class.__dict__.iteritems():
-            if not str(enum_key).startswith("__") and value == enum_value:
-                return enum_value
-
-        return None
+        return enum_table(enum_class)[self.read_signed_byte()]
 
     def write_enum(self, value):
-        self.write_bytes(struct.pack(RemoteProcessClient.BYTE_ORDER_FORMAT_STRING + "b", -1 if value is None else value))
+        self.write_bytes(RemoteProcessClient.SIGNED_BYTE_STRUCT.pack(-1 if value is None else value))
 
     def read_string(self):
         length = self.read_int()
@@ -236,55 +293,137 @@ class RemoteProcessClient:
         self.write_int(len(byte_array))
         self.write_bytes(byte_array)
 
+    def read_signed_byte(self):
+        return RemoteProcessClient.SIGNED_BYTE_STRUCT.unpack_from(
+            self.read_buffer, self.read_buffered(RemoteProcessClient.SIGNED_BYTE_SIZE_BYTES)
+        )[0]
+
+    def read_signed_byte_array(self, count):
+        return struct.unpack_from(
+            RemoteProcessClient.BYTE_ORDER_FORMAT_STRING + str(count) + "b",
+            self.read_buffer, self.read_buffered(count * RemoteProcessClient.SIGNED_BYTE_SIZE_BYTES)
+        )
+
     def read_boolean(self):
-        byte_array = self.read_bytes(RemoteProcessClient.SIGNED_BYTE_SIZE_BYTES)
-        return struct.unpack(RemoteProcessClient.BYTE_ORDER_FORMAT_STRING + "b", byte_array)[0] != 0
+        return self.read_signed_byte() != 0
 
     def read_boolean_array(self, count):
-        byte_array = self.read_bytes(count * RemoteProcessClient.SIGNED_BYTE_SIZE_BYTES)
-        unpacked_bytes = struct.unpack(RemoteProcessClient.BYTE_ORDER_FORMAT_STRING + str(count) + "b", byte_array)
-
-        return [unpacked_bytes[i] != 0 for i in xrange(count)]
+        return [value != 0 for value in self.read_signed_byte_array(count)]
 
     def write_boolean(self, value):
-        self.write_bytes(struct.pack(RemoteProcessClient.BYTE_ORDER_FORMAT_STRING + "b", 1 if value else 0))
+        self.write_bytes(RemoteProcessClient.SIGNED_BYTE_STRUCT.pack(1 if value else 0))
 
     def read_int(self):
-        byte_array = self.read_bytes(RemoteProcessClient.INTEGER_SIZE_BYTES)
-        return struct.unpack(RemoteProcessClient.BYTE_ORDER_FORMAT_STRING + "i", byte_array)[0]
+        return RemoteProcessClient.INTEGER_STRUCT.unpack_from(
+            self.read_buffer, self.read_buffered(RemoteProcessClient.INTEGER_SIZE_BYTES)
+        )[0]
 
     def write_int(self, value):
-        self.write_bytes(struct.pack(RemoteProcessClient.BYTE_ORDER_FORMAT_STRING + "i", value))
+        self.write_bytes(RemoteProcessClient.INTEGER_STRUCT.pack(value))
 
     def read_long(self):
-        byte_array = self.read_bytes(RemoteProcessClient.LONG_SIZE_BYTES)
-        return struct.unpack(RemoteProcessClient.BYTE_ORDER_FORMAT_STRING + "q", byte_array)[0]
+        return RemoteProcessClient.LONG_STRUCT.unpack_from(
+            self.read_buffer, self.read_buffered(RemoteProcessClient.LONG_SIZE_BYTES)
+        )[0]
 
     def write_long(self, value):
-        self.write_bytes(struct.pack(RemoteProcessClient.BYTE_ORDER_FORMAT_STRING + "q", value))
+        self.write_bytes(RemoteProcessClient.LONG_STRUCT.pack(value))
 
     def read_double(self):
-        byte_array = self.read_bytes(RemoteProcessClient.DOUBLE_SIZE_BYTES)
-        return struct.unpack(RemoteProcessClient.BYTE_ORDER_FORMAT_STRING + "d", byte_array)[0]
+        return RemoteProcessClient.DOUBLE_STRUCT.unpack_from(
+            self.read_buffer, self.read_buffered(RemoteProcessClient.DOUBLE_SIZE_BYTES)
+        )[0]
 
     def write_double(self, value):
-        self.write_bytes(struct.pack(RemoteProcessClient.BYTE_ORDER_FORMAT_STRING + "d", value))
+        self.write_bytes(RemoteProcessClient.DOUBLE_STRUCT.pack(value))
+
+    def read_struct(self, struct_):
+        return struct_.unpack_from(self.read_buffer, self.read_buffered(struct_.size))
 
     def read_bytes(self, byte_count):
-        byte_array = ''
+        offset = self.read_buffered(byte_count)
+        return bytes(self.read_buffer[offset:offset + byte_count])
 
-        while len(byte_array) < byte_count:
-            chunk = self.socket.recv(byte_count - len(byte_array))
+    def read_bytearray(self, byte_count):
+        byte_array = bytearray(byte_count)
+        self.read_bytes_into(memoryview(byte_array))
+        return byte_array
 
-            if not len(chunk):
+    def read_bytes_into(self, byte_array_view):
+        byte_count = len(byte_array_view)
+        buffered_byte_count = min(byte_count, self.read_buffer_length - self.read_buffer_offset)
+
+        byte_array_view[:buffered_byte_count] = self.read_buffer_view[
+            self.read_buffer_offset:self.read_buffer_offset + buffered_byte_count
+        ]
+        self.read_buffer_offset += buffered_byte_count
+
+        read_byte_count = buffered_byte_count
+
+        while read_byte_count < byte_count:
+            chunk_size = self.socket.recv_into(byte_array_view[read_byte_count:], byte_count - read_byte_count)
+
+            if not chunk_size:
                 raise IOError("Can't read %s bytes from input stream." % str(byte_count))
 
-            byte_array += chunk
+            read_byte_count += chunk_size
 
-        return byte_array
+    def skip_bytes(self, byte_count):
+        buffered_byte_count = min(byte_count, self.read_buffer_length - self.read_buffer_offset)
+        self.read_buffer_offset += buffered_byte_count
+
+        skipped_byte_count = buffered_byte_count
+
+        while skipped_byte_count < byte_count:
+            chunk_size = self.socket.recv_into(
+                self.read_buffer_view, min(byte_count - skipped_byte_count, len(self.read_buffer))
+            )
+
+            if not chunk_size:
+                raise IOError("Can't skip %s bytes from input stream." % str(byte_count))
+
+            skipped_byte_count += chunk_size
+
+        if skipped_byte_count > buffered_byte_count:
+            self.read_buffer_offset = 0
+            self.read_buffer_length = 0
+
+    def read_buffered(self, byte_count):
+        offset = self.read_buffer_offset
+        buffered_byte_count = self.read_buffer_length - offset
+
+        if buffered_byte_count >= byte_count:
+            self.read_buffer_offset = offset + byte_count
+            return offset
+
+        if byte_count > len(self.read_buffer):
+            read_buffer = bytearray(max(byte_count, 2 * len(self.read_buffer)))
+            read_buffer[:buffered_byte_count] = self.read_buffer[offset:self.read_buffer_length]
+            self.read_buffer = read_buffer
+            self.read_buffer_view = memoryview(read_buffer)
+        elif buffered_byte_count > 0:
+            self.read_buffer[:buffered_byte_count] = self.read_buffer[offset:self.read_buffer_length]
+
+        self.read_buffer_length = buffered_byte_count
+
+        while self.read_buffer_length < byte_count:
+            chunk_size = self.socket.recv_into(self.read_buffer_view[self.read_buffer_length:])
+
+            if not chunk_size:
+                raise IOError("Can't read %s bytes from input stream." % str(byte_count))
+
+            self.read_buffer_length += chunk_size
+
+        self.read_buffer_offset = byte_count
+        return 0
 
     def write_bytes(self, byte_array):
-        self.socket.sendall(byte_array)
+        self.write_buffer += byte_array
+
+    def flush(self):
+        if self.write_buffer:
+            self.socket.sendall(self.write_buffer)
+            del self.write_buffer[:]
 
     class MessageType:
         UNKNOWN = 0
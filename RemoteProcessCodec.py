@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+import inspect
+import struct
+from model.ActionType import ActionType
+from model.Bonus import Bonus
+from model.BonusType import BonusType
+from model.Direction import Direction
+from model.Game import Game
+from model.Move import Move
+from model.Player import Player
+from model.Trooper import Trooper
+from model.TrooperStance import TrooperStance
+from model.TrooperType import TrooperType
+from model.World import World
+
+
+BYTE_ORDER_FORMAT_STRING = "<"
+
+INT = "i"
+LONG = "q"
+DOUBLE = "d"
+BOOLEAN = "?"
+STRING = "read_string"
+
+BOOLEAN_TABLE = (False,) + (True,) * 255
+
+_enum_tables = {}
+
+
+def enum_table(enum_class):
+    """
+    Таблица значений перечисления, индексируемая прочитанным знаковым байтом (-1 и неизвестные значения -> None)
+
+    """
+
+    table = _enum_tables.get(enum_class)
+
+    if table is None:
+        table = [None] * 256
+        for enum_key, enum_value in enum_class.__dict__.iteritems():
+            if not str(enum_key).startswith("__"):
+                table[enum_value] = enum_value
+        table = _enum_tables[enum_class] = tuple(table)
+
+    return table
+
+
+class RecordCodec:
+    """
+    Кодек записи протокола, собранный из схемы полей (имя, тип) в порядке аргументов конструктора модели
+
+    Подряд идущие поля фиксированного размера читаются одним struct.unpack, перечисления и флаги
+    переводятся в значения по таблицам. Поля переменной длины читаются методом клиента с именем типа поля.
+
+    """
+
+    def __init__(self, record_class, fields):
+        self.record_class = record_class
+        self.fields = fields
+        self.segments = []
+
+        segment_format = ""
+        segment_tables = []
+
+        for field_name, field_type in fields:
+            if field_type in (INT, LONG, DOUBLE):
+                segment_format += field_type
+            elif field_type == BOOLEAN:
+                segment_tables.append((len(segment_format), BOOLEAN_TABLE))
+                segment_format += "b"
+            elif inspect.isclass(field_type):
+                segment_tables.append((len(segment_format), enum_table(field_type)))
+                segment_format += "b"
+            else:
+                self._close_segment(segment_format, segment_tables)
+                self.segments.append((None, field_type))
+                segment_format = ""
+                segment_tables = []
+
+        self._close_segment(segment_format, segment_tables)
+
+        self.struct = self.segments[0][0] if len(self.segments) == 1 else None
+
+    def _close_segment(self, segment_format, segment_tables):
+        if segment_format:
+            self.segments.append((struct.Struct(BYTE_ORDER_FORMAT_STRING + segment_format), tuple(segment_tables)))
+
+    def read(self, client):
+        values = []
+
+        for segment_struct, segment_tables in self.segments:
+            if segment_struct is None:
+                values.append(getattr(client, segment_tables)())
+                continue
+
+            offset = len(values)
+            values.extend(client.read_struct(segment_struct))
+
+            for index, table in segment_tables:
+                values[offset + index] = table[values[offset + index]]
+
+        return self.record_class(*values)
+
+    def record_from_values(self, values):
+        """
+        Запись из сырых значений единственного struct-сегмента (флаги и перечисления ещё байтами)
+
+        """
+
+        values = list(values)
+
+        for index, table in self.segments[0][1]:
+            values[index] = table[values[index]]
+
+        return self.record_class(*values)
+
+    def pack(self, record):
+        if self.struct is None:
+            raise ValueError("Can't pack record with variable length fields [class=%s]." % self.record_class.__name__)
+
+        values = []
+
+        for field_name, field_type in self.fields:
+            value = getattr(record, field_name)
+
+            if field_type == BOOLEAN:
+                value = 1 if value else 0
+            elif inspect.isclass(field_type) and value is None:
+                value = -1
+
+            values.append(value)
+
+        return self.struct.pack(*values)
+
+
+GAME_CODEC = RecordCodec(Game, (
+    ("move_count", INT),
+    ("last_player_elimination_score", INT), ("player_elimination_score", INT),
+    ("trooper_elimination_score", INT), ("trooper_damage_score_factor", DOUBLE),
+    ("stance_change_cost", INT), ("standing_move_cost", INT), ("kneeling_move_cost", INT), ("prone_move_cost", INT),
+    ("commander_aura_bonus_action_points", INT), ("commander_aura_range", DOUBLE),
+    ("commander_request_enemy_disposition_cost", INT), ("commander_request_enemy_disposition_max_offset", INT),
+    ("field_medic_heal_cost", INT), ("field_medic_heal_bonus_hitpoints", INT),
+    ("field_medic_heal_self_bonus_hitpoints", INT),
+    ("sniper_standing_stealth_bonus", DOUBLE), ("sniper_kneeling_stealth_bonus", DOUBLE),
+    ("sniper_prone_stealth_bonus", DOUBLE),
+    ("sniper_standing_shooting_range_bonus", DOUBLE), ("sniper_kneeling_shooting_range_bonus", DOUBLE),
+    ("sniper_prone_shooting_range_bonus", DOUBLE), ("scout_stealth_bonus_negation", DOUBLE),
+    ("grenade_throw_cost", INT), ("grenade_throw_range", DOUBLE), ("grenade_direct_damage", INT),
+    ("grenade_collateral_damage", INT),
+    ("medikit_use_cost", INT), ("medikit_bonus_hitpoints", INT), ("medikit_heal_self_bonus_hitpoints", INT),
+    ("field_ration_eat_cost", INT), ("field_ration_bonus_action_points", INT),
+))
+
+TROOPER_CODEC = RecordCodec(Trooper, (
+    ("id", LONG), ("x", INT), ("y", INT), ("player_id", LONG),
+    ("teammate_index", INT), ("teammate", BOOLEAN), ("type", TrooperType), ("stance", TrooperStance),
+    ("hitpoints", INT), ("maximal_hitpoints", INT), ("action_points", INT), ("initial_action_points", INT),
+    ("vision_range", DOUBLE), ("shooting_range", DOUBLE), ("shoot_cost", INT),
+    ("standing_damage", INT), ("kneeling_damage", INT), ("prone_damage", INT), ("damage", INT),
+    ("holding_grenade", BOOLEAN), ("holding_medikit", BOOLEAN), ("holding_field_ration", BOOLEAN),
+))
+
+BONUS_CODEC = RecordCodec(Bonus, (
+    ("id", LONG), ("x", INT), ("y", INT), ("type", BonusType),
+))
+
+PLAYER_CODEC = RecordCodec(Player, (
+    ("id", LONG), ("name", STRING), ("score", INT), ("strategy_crashed", BOOLEAN),
+    ("approximate_x", INT), ("approximate_y", INT),
+))
+
+WORLD_CODEC = RecordCodec(World, (
+    ("move_index", INT), ("width", INT), ("height", INT),
+    ("players", "read_players"), ("troopers", "read_troopers"), ("bonuses", "read_bonuses"),
+    ("cells", "read_cells"), ("cell_visibilities", "read_cell_visibilities"),
+))
+
+MOVE_CODEC = RecordCodec(Move, (
+    ("action", ActionType), ("direction", Direction), ("x", INT), ("y", INT),
+))
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+import mmap
+from RemoteProcessClient import RemoteProcessClient
+from StreamRecorder import StreamRecorder
+from model.Move import Move
+
+
+class ReplayStream:
+    """
+    Входящий поток протокола, читаемый из записи StreamRecorder вместо сокета
+
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as replay_file:
+            self.data = mmap.mmap(replay_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic_size = len(StreamRecorder.MAGIC)
+        if self.data[:magic_size] != StreamRecorder.MAGIC:
+            raise ValueError("File %s is not a protocol recording." % path)
+
+        self.stream_start = magic_size
+        self.stream_end = len(self.data)
+        self.index = None
+
+        trailer_size = StreamRecorder.TRAILER_STRUCT.size
+        if len(self.data) >= magic_size + trailer_size:
+            index_offset, entry_count, magic = StreamRecorder.TRAILER_STRUCT.unpack_from(
+                self.data, len(self.data) - trailer_size
+            )
+
+            if magic == StreamRecorder.MAGIC:
+                self.stream_end = index_offset
+                self.index = [
+                    StreamRecorder.INDEX_ENTRY_STRUCT.unpack_from(
+                        self.data, index_offset + entry_index * StreamRecorder.INDEX_ENTRY_STRUCT.size
+                    ) for entry_index in xrange(entry_count)
+                ]
+
+        self.position = self.stream_start
+
+    @property
+    def received_byte_count(self):
+        return self.position - self.stream_start
+
+    def seek(self, stream_offset):
+        self.position = self.stream_start + stream_offset
+
+    def recv_into(self, buffer_, byte_count=0):
+        chunk_size = min(byte_count or len(buffer_), self.stream_end - self.position)
+        buffer_[:chunk_size] = self.data[self.position:self.position + chunk_size]
+        self.position += chunk_size
+        return chunk_size
+
+    def add_index_entry(self, stream_offset, message_type, move_index=-1):
+        self.index.append((stream_offset, message_type, move_index))
+
+    def sendall(self, byte_array):
+        pass
+
+    def close(self):
+        self.data.close()
+
+
+class ReplayClient(RemoteProcessClient):
+    """
+    Клиент с API чтения RemoteProcessClient, воспроизводящий записанную игру без local-runner'а
+
+    Ходы стратегии не отправляются, а складываются в moves (action, direction, x, y) для сравнения решений.
+    seek_to_move переходит сразу к первому сообщению указанного хода.
+
+    """
+
+    def __init__(self, path, cell_visibilities_cache_dir=None, compact_cell_visibilities=False, trooper_tables=False):
+        self.init_state(ReplayStream(path), cell_visibilities_cache_dir, compact_cell_visibilities, trooper_tables)
+        self.moves = []
+
+        if self.socket.index is None:
+            self.build_index()
+
+    def build_index(self):
+        self.socket.index = []
+        self.recorder = self.socket
+
+        try:
+            self.read_team_size()
+            self.read_game_context()
+
+            while self.read_player_context() is not None:
+                pass
+        except IOError:
+            pass
+        finally:
+            self.recorder = None
+
+        self.seek(0)
+
+    def seek(self, stream_offset):
+        self.socket.seek(stream_offset)
+        self.read_buffer_offset = 0
+        self.read_buffer_length = 0
+
+    def message_offsets(self, message_type=RemoteProcessClient.MessageType.PLAYER_CONTEXT):
+        return [(offset, move_index) for offset, entry_type, move_index in self.socket.index
+                if entry_type == message_type]
+
+    def seek_to_move(self, move_index):
+        player_contexts = self.message_offsets()
+
+        offsets = [offset for offset, entry_move_index in player_contexts if entry_move_index == move_index]
+        if not offsets:
+            raise ValueError("Move %s is not found in recording." % move_index)
+
+        # клетки и видимости передаются только в первом мире игры
+        if self.cells is None and player_contexts:
+            self.seek(player_contexts[0][0])
+            self.read_player_context()
+
+        self.seek(offsets[0])
+
+    def write_token(self, token):
+        pass
+
+    def write_protocol_version(self):
+        pass
+
+    def write_move(self, move):
+        self.moves.append(None if move is None else (move.action, move.direction, move.x, move.y))
+
+    def close(self):
+        self.socket.close()
+
+
+def replay(path, strategy_class, from_move_index=None):
+    """
+    Прогоняем стратегию по записанной игре (начиная с хода from_move_index), отдаём список её ходов
+
+    """
+
+    client = ReplayClient(path)
+
+    try:
+        team_size = client.read_team_size()
+        game = client.read_game_context()
+        strategies = [strategy_class() for strategy_index in xrange(team_size)]
+
+        if from_move_index is not None:
+            client.seek_to_move(from_move_index)
+
+        while True:
+            player_context = client.read_player_context()
+            if player_context is None:
+                break
+
+            player_trooper = player_context.trooper
+
+            move = Move()
+            strategies[player_trooper.teammate_index].move(player_trooper, player_context.world, game, move)
+            client.write_move(move)
+
+        return client.moves
+    finally:
+        client.close()
@@ -1,19 +1,42 @@
+import json
+import logging
+import os
 import sys
-from MyStrategy import MyStrategy
+import SharedVars as shared
+from Instrumentation import Instrumentation
+from MoveDeadline import latency_percentiles
+from MyStrategy import MyStrategy, MOVE_time_budget
 from RemoteProcessClient import RemoteProcessClient
 from model.Move import Move
 
 
 class Runner:
     def __init__(self):
+        cell_visibilities_cache_dir = os.environ.get("CELL_VISIBILITIES_CACHE_DIR")
+        record_path = os.environ.get("PROTOCOL_RECORD_PATH")
+        compact_cell_visibilities = bool(os.environ.get("COMPACT_CELL_VISIBILITIES"))
+        trooper_tables = bool(os.environ.get("TROOPER_TABLES"))
+        self.instrumentation_path = os.environ.get("INSTRUMENTATION_PATH")
+
         if sys.argv.__len__() == 4:
-            self.remote_process_client = RemoteProcessClient(sys.argv[1], int(sys.argv[2]))
+            self.remote_process_client = RemoteProcessClient(
+                sys.argv[1], int(sys.argv[2]), cell_visibilities_cache_dir, record_path, compact_cell_visibilities,
+                trooper_tables
+            )
             self.token = sys.argv[3]
         else:
-            self.remote_process_client = RemoteProcessClient("127.0.0.1", 31001)
+            self.remote_process_client = RemoteProcessClient(
+                "127.0.0.1", 31001, cell_visibilities_cache_dir, record_path, compact_cell_visibilities,
+                trooper_tables
+            )
             self.token = "0000000000000000"
 
     def run(self):
+        instrumentation = None
+        if self.instrumentation_path is not None:
+            instrumentation = Instrumentation()
+            instrumentation.enable()
+
         try:
             self.remote_process_client.write_token(self.token)
             team_size = self.remote_process_client.read_team_size()
@@ -28,6 +51,12 @@ class Runner:
             while True:
                 player_context = self.remote_process_client.read_player_context()
                 if player_context is None:
+                    logging.info("move latency %s" % json.dumps(latency_percentiles(shared.move_latencies,
+                                                                                   MOVE_time_budget), sort_keys=True))
+                    if shared.path_cache is not None:
+                        logging.info("path cache %s" % json.dumps(shared.path_cache.stats(), sort_keys=True))
+                    if instrumentation is not None:
+                        instrumentation.dump(self.instrumentation_path)
                     break
 
                 player_trooper = player_context.trooper
@@ -36,6 +65,8 @@ class Runner:
                 strategies[player_trooper.teammate_index].move(player_trooper, player_context.world, game, move)
                 self.remote_process_client.write_move(move)
         finally:
+            if instrumentation is not None:
+                instrumentation.disable()
             self.remote_process_client.close()
 
 
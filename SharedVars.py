@@ -1,6 +1,13 @@
 
 way_points = None
 current_dest_waypoint = None
+threat_map = None
 
 
 
+passability_grid = None
+distance_fields = None
+path_cache = None
+hierarchical_path_finder = None
+
+move_latencies = None
@@ -0,0 +1,604 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import SharedVars as shared
+from MoveDeadline import latency_percentiles
+from MyStrategy import MyStrategy, MOVE_time_budget
+from PathCache import combined_stats
+from ReplayClient import ReplayClient
+from model.ActionType import ActionType
+from model.Bonus import Bonus
+from model.BonusType import BonusType
+from model.CellType import CellType
+from model.Direction import Direction
+from model.Move import Move
+from model.Player import Player
+from model.Trooper import Trooper
+from model.TrooperStance import TrooperStance
+from model.TrooperType import TrooperType
+from model.World import World
+
+
+SHARED_DEFAULTS = dict((name, value) for name, value in vars(shared).iteritems() if not name.startswith("_"))
+
+# отражения стартовой расстановки по игрокам: (по x, по y); при двух игроках - только противоположный угол
+MIRRORS = [(False, False), (True, True), (True, False), (False, True)]
+
+DIRECTION_OFFSETS = {
+    Direction.CURRENT_POINT: (0, 0),
+    Direction.NORTH: (0, -1),
+    Direction.EAST: (1, 0),
+    Direction.SOUTH: (0, 1),
+    Direction.WEST: (-1, 0),
+}
+
+BONUS_HOLDING_FIELDS = {
+    BonusType.GRENADE: "holding_grenade",
+    BonusType.MEDIKIT: "holding_medikit",
+    BonusType.FIELD_RATION: "holding_field_ration",
+}
+
+
+class Scenario:
+    """
+    Стартовые условия симуляции: константы Game, карта, видимости клеток и свой отряд с бонусами из первого мира записи
+
+    Отряды остальных игроков - зеркальные копии своего по углам карты (карты чемпионата симметричны),
+    бонусы отражаются так же.
+
+    Сценарий берётся только из записи протокола (PROTOCOL_RECORD_PATH): видимости клеток считает локальный раннер,
+    своего расчёта линии видимости у нас нет, а приближённый разошёлся бы с игрой. Для новой карты достаточно
+    записать одну игру на ней.
+
+    """
+
+    def __init__(self, game, world, player_count=None):
+        self.game = game
+        self.width = world.width
+        self.height = world.height
+        self.cells = world.cells
+        self.cell_visibilities = world.cell_visibilities
+
+        self.player_count = player_count or len(world.players)
+        if self.player_count not in (2, 4):
+            raise ValueError("Unsupported player count: %s." % self.player_count)
+
+        self.team = sorted([t for t in world.troopers if t.teammate], key=lambda t: t.teammate_index)
+        if not self.team:
+            raise ValueError("No own troopers in the first world.")
+
+        self.bonuses = list(world.bonuses)
+
+    @staticmethod
+    def from_recording(path, player_count=None):
+        client = ReplayClient(path)
+
+        try:
+            client.read_team_size()
+            game = client.read_game_context()
+            player_context = client.read_player_context()
+        finally:
+            client.close()
+
+        if player_context is None:
+            raise ValueError("Recording %s has no player context." % path)
+
+        return Scenario(game, player_context.world, player_count)
+
+    def mirror(self, x, y, mirror):
+        mirror_x, mirror_y = mirror
+        return (self.width - 1 - x if mirror_x else x), (self.height - 1 - y if mirror_y else y)
+
+
+class StrategyTeam:
+    """
+    Стратегии одного игрока и его собственная копия SharedVars (как в MultiRunner.GameSession)
+
+    """
+
+    def __init__(self, player, strategy_class, team_size):
+        self.player = player
+        self.strategies = [strategy_class() for teammate_index in xrange(team_size)]
+        self.shared_state = copy.deepcopy(SHARED_DEFAULTS)
+
+    def move(self, me, world, game, move):
+        for name, value in self.shared_state.iteritems():
+            setattr(shared, name, value)
+
+        try:
+            self.strategies[me.teammate_index].move(me, world, game, move)
+        finally:
+            for name in self.shared_state:
+                self.shared_state[name] = getattr(shared, name)
+
+
+class SimulatedGame:
+    """
+    Игра без local-runner'а: правила боя по константам Game, стратегии вызываются напрямую, без сокета
+
+    Каждый ход бойцы ходят по типам в случайном на игру порядке, внутри типа - игроки по очереди.
+    Боец получает свои очки действия (плюс бонус ауры командира рядом) и действует, пока не закончит ход,
+    не кончатся очки или не сделает недопустимое действие. Игрок видит своих бойцов и тех чужих,
+    кого видит хоть один его боец (с учётом маскировки снайпера); бонусы видны все.
+    Упавшая стратегия помечается strategy_crashed, её бойцы стоят до конца игры.
+
+    """
+
+    ACTION_LIMIT = 64
+
+    def __init__(self, scenario, strategy_classes=None, seed=None):
+        self.scenario = scenario
+        self.game = scenario.game
+        self.random = random.Random(seed)
+        self.seed = seed
+
+        # видимости клеток без бойцов: для проверок самого симулятора
+        self.terrain = World(0, scenario.width, scenario.height, [], [], [], scenario.cells,
+                             scenario.cell_visibilities)
+
+        team_size = len(scenario.team)
+        strategy_classes = strategy_classes or [MyStrategy] * scenario.player_count
+
+        self.players = []
+        self.teams = {}
+        self.troopers = []
+        self.scores = {}
+
+        for player_index, mirror in enumerate(MIRRORS[:scenario.player_count]):
+            player = Player(player_index + 1, "%s %d" % (strategy_classes[player_index].__name__, player_index + 1),
+                            0, False, -1, -1)
+            self.players.append(player)
+            self.teams[player.id] = StrategyTeam(player, strategy_classes[player_index], team_size)
+            self.scores[player.id] = 0.0
+
+            for t in scenario.team:
+                x, y = scenario.mirror(t.x, t.y, mirror)
+                if scenario.cells[x][y] != CellType.FREE:
+                    raise ValueError("Map is not symmetric: start cell %s is not free." % str((x, y)))
+
+                self.troopers.append(Trooper(
+                    player_index * team_size + t.teammate_index + 1, x, y, player.id, t.teammate_index, False, t.type,
+                    t.stance, t.hitpoints, t.maximal_hitpoints, t.initial_action_points, t.initial_action_points,
+                    t.vision_range, t.shooting_range, t.shoot_cost, t.standing_damage, t.kneeling_damage,
+                    t.prone_damage, t.damage, t.holding_grenade, t.holding_medikit, t.holding_field_ration
+                ))
+
+        bonus_cells = {}
+        for mirror in MIRRORS[:scenario.player_count]:
+            for b in scenario.bonuses:
+                x, y = scenario.mirror(b.x, b.y, mirror)
+                bonus_cells.setdefault((x, y), b.type)
+        # id бонусов идут после id всех бойцов, чтобы не пересекаться с ними
+        first_bonus_id = scenario.player_count * team_size + 1
+        self.bonuses = [Bonus(first_bonus_id + bonus_index, x, y, bonus_type)
+                        for bonus_index, ((x, y), bonus_type) in enumerate(sorted(bonus_cells.iteritems()))]
+
+        self.trooper_types = sorted(set(t.type for t in scenario.team))
+        self.random.shuffle(self.trooper_types)
+
+        self.move_costs = {
+            TrooperStance.PRONE: self.game.prone_move_cost,
+            TrooperStance.KNEELING: self.game.kneeling_move_cost,
+            TrooperStance.STANDING: self.game.standing_move_cost,
+        }
+
+        self.move_index = 0
+        self.dispositions = {}
+        self.strategy_move_count = 0
+        self.strategy_time = 0.0
+
+    def play(self):
+        """
+        Играем до конца (move_count ходов или пока не останется один игрок), отдаём результаты по игрокам
+
+        """
+
+        for move_index in xrange(self.game.move_count):
+            self.move_index = move_index
+
+            for trooper_type in self.trooper_types:
+                for player in self.players:
+                    if player.strategy_crashed:
+                        continue
+
+                    trooper = self.trooper_of(player.id, trooper_type)
+                    if trooper is not None:
+                        self.play_trooper_turn(trooper)
+
+                    if self.is_over():
+                        return self.results()
+
+        return self.results()
+
+    def trooper_of(self, player_id, trooper_type):
+        for t in self.troopers:
+            if t.player_id == player_id and t.type == trooper_type:
+                return t
+
+        return None
+
+    def is_over(self):
+        return len(set(t.player_id for t in self.troopers)) <= 1
+
+    def results(self):
+        """
+        Игроки по местам: (место, id игрока, очки, упала ли стратегия, делит ли место с другими)
+
+        При равных очках место общее (1, 1, 3, ...), порядок игроков на место не влияет.
+
+        """
+
+        scores = [self.scores[p.id] for p in self.players]
+        ranked = sorted(self.players, key=lambda p: -self.scores[p.id])
+
+        return [(1 + len([score for score in scores if score > self.scores[p.id]]), p.id, int(self.scores[p.id]),
+                 p.strategy_crashed, scores.count(self.scores[p.id]) > 1) for p in ranked]
+
+    def play_trooper_turn(self, trooper):
+        game = self.game
+        team = self.teams[trooper.player_id]
+
+        trooper.action_points = trooper.initial_action_points
+        if trooper.type != TrooperType.COMMANDER and [
+            t for t in self.troopers if t.player_id == trooper.player_id and t.type == TrooperType.COMMANDER and
+            t.get_distance_to(trooper.x, trooper.y) <= game.commander_aura_range
+        ]:
+            trooper.action_points += game.commander_aura_bonus_action_points
+
+        for action_index in xrange(SimulatedGame.ACTION_LIMIT):
+            world = self.world_for(trooper.player_id)
+            me = [t for t in world.troopers if t.id == trooper.id][0]
+            move = Move()
+
+            started_at = time.time()
+            try:
+                team.move(me, world, game, move)
+            except Exception:
+                logging.exception("strategy of player %d crashed" % trooper.player_id)
+                team.player.strategy_crashed = True
+                break
+            finally:
+                self.strategy_time += time.time() - started_at
+                self.strategy_move_count += 1
+
+            if move.action == ActionType.END_TURN or not self.apply_move(trooper, move):
+                break
+
+            if trooper.hitpoints <= 0 or trooper.action_points <= 0 or self.is_over():
+                break
+
+        self.dispositions.pop(trooper.player_id, None)
+
+    def can_see(self, viewer, target):
+        game = self.game
+        vision_range = viewer.vision_range
+
+        if target.type == TrooperType.SNIPER:
+            stealth_bonus = [game.sniper_prone_stealth_bonus, game.sniper_kneeling_stealth_bonus,
+                             game.sniper_standing_stealth_bonus][target.stance]
+            if viewer.type == TrooperType.SCOUT:
+                stealth_bonus *= 1.0 - game.scout_stealth_bonus_negation
+            vision_range -= stealth_bonus
+
+        return self.terrain.is_visible(vision_range, viewer.x, viewer.y, viewer.stance,
+                                       target.x, target.y, target.stance)
+
+    def shooting_range(self, trooper):
+        if trooper.type != TrooperType.SNIPER:
+            return trooper.shooting_range
+
+        game = self.game
+        return trooper.shooting_range + [game.sniper_prone_shooting_range_bonus,
+                                         game.sniper_kneeling_shooting_range_bonus,
+                                         game.sniper_standing_shooting_range_bonus][trooper.stance]
+
+    def world_for(self, player_id):
+        """
+        Снимок мира глазами игрока: свежие копии бойцов, чтобы стратегия не могла поменять состояние игры
+
+        """
+
+        team = [t for t in self.troopers if t.player_id == player_id]
+        visible = [t for t in self.troopers if t.player_id == player_id or [v for v in team if self.can_see(v, t)]]
+
+        troopers = [Trooper(
+            t.id, t.x, t.y, t.player_id, t.teammate_index, t.player_id == player_id, t.type, t.stance, t.hitpoints,
+            t.maximal_hitpoints, t.action_points, t.initial_action_points, t.vision_range, t.shooting_range,
+            t.shoot_cost, t.standing_damage, t.kneeling_damage, t.prone_damage, t.get_damage(t.stance),
+            t.holding_grenade, t.holding_medikit, t.holding_field_ration
+        ) for t in visible]
+
+        dispositions = self.dispositions.get(player_id, {})
+        players = [Player(p.id, p.name, int(self.scores[p.id]), p.strategy_crashed,
+                          *dispositions.get(p.id, (-1, -1))) for p in self.players]
+        bonuses = [Bonus(b.id, b.x, b.y, b.type) for b in self.bonuses]
+
+        return World(self.move_index, self.scenario.width, self.scenario.height, players, troopers, bonuses,
+                     self.scenario.cells, self.scenario.cell_visibilities)
+
+    def trooper_at(self, x, y):
+        for t in self.troopers:
+            if t.x == x and t.y == y:
+                return t
+
+        return None
+
+    def apply_move(self, trooper, move):
+        """
+        Выполняем действие бойца; False - если действие недопустимо (тогда ход бойца заканчивается)
+
+        """
+
+        game = self.game
+        action = move.action
+
+        if move.direction is not None:
+            offset_x, offset_y = DIRECTION_OFFSETS[move.direction]
+            x, y = trooper.x + offset_x, trooper.y + offset_y
+        else:
+            x, y = move.x, move.y
+
+        inside = 0 <= x < self.scenario.width and 0 <= y < self.scenario.height
+        target = self.trooper_at(x, y) if inside else None
+        nearby = inside and abs(x - trooper.x) + abs(y - trooper.y) <= 1
+
+        if action == ActionType.MOVE:
+            cost = self.move_costs[trooper.stance]
+            if trooper.action_points < cost or not nearby or target is not None or \
+               self.scenario.cells[x][y] != CellType.FREE:
+                return False
+
+            trooper.action_points -= cost
+            trooper.x, trooper.y = x, y
+            self.pick_up_bonus(trooper)
+        elif action == ActionType.SHOOT:
+            if trooper.action_points < trooper.shoot_cost or target is None or \
+               not self.terrain.is_visible(self.shooting_range(trooper), trooper.x, trooper.y, trooper.stance,
+                                           target.x, target.y, target.stance):
+                return False
+
+            trooper.action_points -= trooper.shoot_cost
+            self.damage(trooper, target, trooper.get_damage(trooper.stance))
+        elif action == ActionType.RAISE_STANCE or action == ActionType.LOWER_STANCE:
+            stance = trooper.stance + (1 if action == ActionType.RAISE_STANCE else -1)
+            if trooper.action_points < game.stance_change_cost or \
+               not TrooperStance.PRONE <= stance <= TrooperStance.STANDING:
+                return False
+
+            trooper.action_points -= game.stance_change_cost
+            trooper.stance = stance
+        elif action == ActionType.THROW_GRENADE:
+            if trooper.action_points < game.grenade_throw_cost or not trooper.holding_grenade or not inside or \
+               trooper.get_distance_to(x, y) > game.grenade_throw_range:
+                return False
+
+            trooper.action_points -= game.grenade_throw_cost
+            trooper.holding_grenade = False
+            for t in list(self.troopers):
+                distance = abs(t.x - x) + abs(t.y - y)
+                if distance == 0:
+                    self.damage(trooper, t, game.grenade_direct_damage)
+                elif distance == 1:
+                    self.damage(trooper, t, game.grenade_collateral_damage)
+        elif action == ActionType.USE_MEDIKIT:
+            if trooper.action_points < game.medikit_use_cost or not trooper.holding_medikit or target is None or \
+               not nearby or target.player_id != trooper.player_id:
+                return False
+
+            trooper.action_points -= game.medikit_use_cost
+            trooper.holding_medikit = False
+            self.heal(target, game.medikit_heal_self_bonus_hitpoints if target is trooper else
+                      game.medikit_bonus_hitpoints)
+        elif action == ActionType.EAT_FIELD_RATION:
+            if trooper.action_points < game.field_ration_eat_cost or not trooper.holding_field_ration:
+                return False
+
+            trooper.action_points += game.field_ration_bonus_action_points - game.field_ration_eat_cost
+            trooper.holding_field_ration = False
+        elif action == ActionType.HEAL:
+            if trooper.type != TrooperType.FIELD_MEDIC or trooper.action_points < game.field_medic_heal_cost or \
+               target is None or not nearby or target.player_id != trooper.player_id:
+                return False
+
+            trooper.action_points -= game.field_medic_heal_cost
+            self.heal(target, game.field_medic_heal_self_bonus_hitpoints if target is trooper else
+                      game.field_medic_heal_bonus_hitpoints)
+        elif action == ActionType.REQUEST_ENEMY_DISPOSITION:
+            if trooper.type != TrooperType.COMMANDER or \
+               trooper.action_points < game.commander_request_enemy_disposition_cost:
+                return False
+
+            trooper.action_points -= game.commander_request_enemy_disposition_cost
+            self.dispositions[trooper.player_id] = self.enemy_disposition(trooper.player_id)
+        else:
+            return False
+
+        return True
+
+    def pick_up_bonus(self, trooper):
+        for b in self.bonuses:
+            if b.x == trooper.x and b.y == trooper.y:
+                if not getattr(trooper, BONUS_HOLDING_FIELDS[b.type]):
+                    setattr(trooper, BONUS_HOLDING_FIELDS[b.type], True)
+                    self.bonuses.remove(b)
+                return
+
+    @staticmethod
+    def heal(trooper, hitpoints):
+        trooper.hitpoints = min(trooper.hitpoints + hitpoints, trooper.maximal_hitpoints)
+
+    def damage(self, attacker, target, damage):
+        game = self.game
+        damage = min(damage, target.hitpoints)
+        target.hitpoints -= damage
+
+        is_enemy = target.player_id != attacker.player_id
+        if is_enemy:
+            self.scores[attacker.player_id] += damage * game.trooper_damage_score_factor
+
+        if target.hitpoints > 0:
+            return
+
+        self.troopers.remove(target)
+        if not is_enemy:
+            return
+
+        self.scores[attacker.player_id] += game.trooper_elimination_score
+        if not [t for t in self.troopers if t.player_id == target.player_id]:
+            if len(set(t.player_id for t in self.troopers)) <= 1:
+                self.scores[attacker.player_id] += game.last_player_elimination_score
+            else:
+                self.scores[attacker.player_id] += game.player_elimination_score
+
+    def enemy_disposition(self, player_id):
+        """
+        Примерные координаты чужих отрядов: центр живых бойцов со случайным сдвигом до max_offset клеток
+
+        """
+
+        max_offset = self.game.commander_request_enemy_disposition_max_offset
+        out = {}
+
+        for p in self.players:
+            troopers = [t for t in self.troopers if t.player_id == p.id]
+            if p.id == player_id or not troopers:
+                continue
+
+            x = sum(t.x for t in troopers) / len(troopers) + self.random.randint(-max_offset, max_offset)
+            y = sum(t.y for t in troopers) / len(troopers) + self.random.randint(-max_offset, max_offset)
+            out[p.id] = (min(max(x, 0), self.scenario.width - 1), min(max(y, 0), self.scenario.height - 1))
+
+        return out
+
+
+_worker_scenario = None
+
+
+def _init_worker(recording_path, player_count):
+    global _worker_scenario
+
+    logging.disable(logging.INFO)
+    _worker_scenario = Scenario.from_recording(recording_path, player_count)
+
+
+def _play_game(seed):
+    # стратегии тоже пользуются random (выбор среди равных путей)
+    random.seed(seed)
+
+    started_at = time.time()
+    simulated_game = SimulatedGame(_worker_scenario, seed=seed)
+    results = simulated_game.play()
+    latencies = sum([team.shared_state["move_latencies"] or [] for team in simulated_game.teams.itervalues()], [])
+    path_cache_stats = [team.shared_state["path_cache"].stats() for team in simulated_game.teams.itervalues()
+                        if team.shared_state["path_cache"] is not None]
+
+    return results, simulated_game.strategy_move_count, simulated_game.strategy_time, latencies, path_cache_stats, \
+        time.time() - started_at
+
+
+class Arena:
+    """
+    Серия игр симулятора в самоигре на нескольких процессах: места, очки, победы и ничьи игроков,
+    скорость в ходах стратегии в секунду и перцентили задержки ходов (см. MoveDeadline)
+
+    Если задан ARENA_METRICS_PATH, сводка дописывается туда строкой JSON - так скорость отслеживается между версиями.
+
+    """
+
+    def __init__(self, recording_path, game_count, process_count=None, player_count=None, base_seed=0):
+        self.recording_path = recording_path
+        self.game_count = game_count
+        self.process_count = process_count or multiprocessing.cpu_count()
+        self.player_count = player_count
+        self.base_seed = base_seed
+        self.metrics_path = os.environ.get("ARENA_METRICS_PATH")
+
+    def run(self):
+        seeds = range(self.base_seed, self.base_seed + self.game_count)
+        started_at = time.time()
+
+        if self.process_count == 1:
+            _init_worker(self.recording_path, self.player_count)
+            try:
+                game_results = map(_play_game, seeds)
+            finally:
+                # логи стратегий глушим только на время игр, сводку ниже пишем в лог
+                logging.disable(logging.NOTSET)
+        else:
+            pool = multiprocessing.Pool(self.process_count, _init_worker, (self.recording_path, self.player_count))
+            try:
+                game_results = pool.map(_play_game, seeds, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+
+        elapsed = time.time() - started_at
+        summary = self.summarize(game_results, elapsed)
+
+        if self.metrics_path is not None:
+            with open(self.metrics_path, "a") as metrics_file:
+                metrics_file.write(json.dumps(summary, sort_keys=True) + "\n")
+
+        logging.info("arena summary %s" % json.dumps(summary, sort_keys=True))
+        return summary
+
+    def summarize(self, game_results, elapsed):
+        move_count = 0
+        strategy_time = 0.0
+        latencies = []
+        path_cache_stats = []
+        players = {}
+
+        for results, game_move_count, game_strategy_time, game_latencies, game_path_cache_stats, game_time \
+                in game_results:
+            move_count += game_move_count
+            strategy_time += game_strategy_time
+            latencies += game_latencies
+            path_cache_stats += game_path_cache_stats
+
+            for place, player_id, score, crashed, shared_place in results:
+                stats = players.setdefault(player_id, dict(places=0, score=0, wins=0, draws=0, crashes=0))
+                stats["places"] += place
+                stats["score"] += score
+                # победа - только единоличное первое место, общее первое - ничья
+                stats["wins"] += place == 1 and not shared_place
+                stats["draws"] += place == 1 and shared_place
+                stats["crashes"] += crashed
+
+        game_count = len(game_results)
+        return dict(
+            timestamp=int(time.time()),
+            games=game_count,
+            processes=self.process_count,
+            elapsed=round(elapsed, 3),
+            moves=move_count,
+            moves_per_second=round(move_count / elapsed, 1) if elapsed > 0 else None,
+            strategy_ms_per_move=round(strategy_time / move_count * 1000, 3) if move_count else None,
+            games_per_hour=round(game_count / elapsed * 3600, 1) if elapsed > 0 else None,
+            latency=latency_percentiles(latencies, MOVE_time_budget),
+            path_cache=combined_stats(path_cache_stats),
+            players=dict((str(player_id), dict(avg_place=round(float(stats["places"]) / game_count, 2),
+                                               avg_score=round(float(stats["score"]) / game_count, 1),
+                                               wins=stats["wins"], draws=stats["draws"],
+                                               crashes=stats["crashes"]))
+                         for player_id, stats in players.iteritems()),
+        )
+
+
+if __name__ == "__main__":
+    if 3 <= len(sys.argv) <= 5:
+        logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s', level=logging.INFO)
+        Arena(sys.argv[1], int(sys.argv[2]),
+              int(sys.argv[3]) if len(sys.argv) > 3 else None,
+              int(sys.argv[4]) if len(sys.argv) > 4 else None).run()
+    else:
+        sys.stderr.write("usage: Simulator.py <recording> <game count> [<process count> [<player count>]]\n")
+        sys.exit(1)
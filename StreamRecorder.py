@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import struct
+
+
+class StreamRecorder:
+    """
+    Обёртка сокета, записывающая весь входящий поток протокола в файл для последующего воспроизведения
+
+    Формат файла: MAGIC, сырые входящие байты, индекс сообщений (смещение в потоке, тип сообщения, номер хода)
+    и завершающая запись (смещение индекса, число записей, MAGIC). Если игра оборвалась и индекс не дописан,
+    ReplayClient восстанавливает его, заново декодируя поток.
+
+    """
+
+    MAGIC = "RAICREC1"
+
+    INDEX_ENTRY_STRUCT = struct.Struct("<qbi")
+    TRAILER_STRUCT = struct.Struct("<qi8s")
+
+    def __init__(self, socket_, path):
+        self.socket = socket_
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(StreamRecorder.MAGIC)
+        self.received_byte_count = 0
+        self.index = []
+
+    def recv_into(self, buffer_, byte_count=0):
+        chunk_size = self.socket.recv_into(buffer_, byte_count)
+
+        if chunk_size:
+            self.file.write(buffer_[:chunk_size])
+            self.received_byte_count += chunk_size
+
+        return chunk_size
+
+    def add_index_entry(self, stream_offset, message_type, move_index=-1):
+        self.index.append((stream_offset, message_type, move_index))
+
+    def close(self):
+        if not self.file.closed:
+            index_offset = self.file.tell()
+
+            for entry in self.index:
+                self.file.write(StreamRecorder.INDEX_ENTRY_STRUCT.pack(*entry))
+
+            self.file.write(StreamRecorder.TRAILER_STRUCT.pack(index_offset, len(self.index), StreamRecorder.MAGIC))
+            self.file.close()
+
+        self.socket.close()
+
+    def __getattr__(self, name):
+        return getattr(self.socket, name)
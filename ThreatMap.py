@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import SharedVars as shared
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class ThreatMap:
+    """
+    Карта угроз на ход: для каждой клетки и стойки - число врагов, которые достают до неё из своего оружия,
+    и их суммарный урон за выстрел в текущих стойках
+
+    """
+
+    def __init__(self, world, key=None):
+        self.key = key
+        self.width = world.width
+        self.height = world.height
+
+        stance_count = world.stance_count
+        enemies = [t for t in world.troopers if not t.teammate]
+
+        if numpy is not None:
+            self.enemy_counts = numpy.zeros((stance_count, world.width, world.height), dtype=numpy.int32)
+            self.damages = numpy.zeros((stance_count, world.width, world.height), dtype=numpy.int32)
+
+            for enemy in enemies:
+                damage = enemy.get_damage(enemy.stance)
+                for stance in xrange(stance_count):
+                    mask = numpy.asarray(world.visible_cells(enemy.shooting_range, enemy.x, enemy.y, enemy.stance,
+                                                             stance))
+                    self.enemy_counts[stance] += mask
+                    self.damages[stance] += mask * damage
+
+            self.enemy_counts = self.enemy_counts.tolist()
+            self.damages = self.damages.tolist()
+        else:
+            self.enemy_counts = [[[0] * world.height for x in xrange(world.width)] for stance in xrange(stance_count)]
+            self.damages = [[[0] * world.height for x in xrange(world.width)] for stance in xrange(stance_count)]
+
+            for enemy in enemies:
+                damage = enemy.get_damage(enemy.stance)
+                for stance in xrange(stance_count):
+                    mask = world.visible_cells(enemy.shooting_range, enemy.x, enemy.y, enemy.stance, stance)
+                    enemy_counts = self.enemy_counts[stance]
+                    damages = self.damages[stance]
+                    for x, column in enumerate(mask):
+                        for y, visible in enumerate(column):
+                            if visible:
+                                enemy_counts[x][y] += 1
+                                damages[x][y] += damage
+
+    def enemy_count(self, x, y, stance):
+        return self.enemy_counts[stance][x][y]
+
+    def damage(self, x, y, stance):
+        return self.damages[stance][x][y]
+
+
+def threat_map_for(world, stale_ok=False):
+    """
+    Карта угроз текущего хода, общая для всех бойцов команды
+
+    Пересчитываем, только если сменился ход или расстановка видимых врагов (их открывают наши же бойцы по ходу)
+    stale_ok - при нехватке времени на ход согласны на карту этого же хода, посчитанную до того, как враги
+    открылись или сменили стойку; карту прошлых ходов не берём никогда - пересчитываем
+
+    """
+
+    key = (world.move_index, tuple((t.id, t.x, t.y, t.stance) for t in world.troopers if not t.teammate))
+
+    if stale_ok and shared.threat_map is not None and shared.threat_map.key[0] == world.move_index and \
+       (shared.threat_map.width, shared.threat_map.height) == (world.width, world.height):
+        return shared.threat_map
+
+    if shared.threat_map is None or shared.threat_map.key != key:
+        shared.threat_map = ThreatMap(world, key)
+
+    return shared.threat_map
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+from RemoteProcessCodec import TROOPER_CODEC, INT, LONG, DOUBLE
+
+
+class TrooperTable:
+    """
+    Бойцы снимка мира в виде столбцов (struct-of-arrays): по массиву array на каждое поле Trooper
+
+    Декодер дописывает в столбцы распакованные записи протокола как есть (флаги и перечисления - байтами),
+    объекты Trooper создаются лениво при первом обращении к бойцу. Векторному коду хватает столбцов
+    (column("x"), numpy.frombuffer по нему), остальной код видит обычный список бойцов.
+    Там, где array("l") 32-битный (Windows и прочие LLP64), long-поля хранятся в обычном списке.
+
+    """
+
+    # None - столбец-список: 64-битного типа у array может не быть
+    TYPECODES = {INT: "i", LONG: "l" if array("l").itemsize == 8 else None, DOUBLE: "d"}
+
+    def __init__(self):
+        self.names = [field_name for field_name, field_type in TROOPER_CODEC.fields]
+        self.columns = [TrooperTable.new_column(TrooperTable.TYPECODES.get(field_type, "b"))
+                        for field_name, field_type in TROOPER_CODEC.fields]
+        self.columns_by_name = dict(zip(self.names, self.columns))
+
+        # строка столбцов (int), уже созданный Trooper или None для пустой записи протокола
+        self.items = []
+
+    @staticmethod
+    def new_column(typecode):
+        return [] if typecode is None else array(typecode)
+
+    def append_values(self, values):
+        self.items.append(len(self.columns[0]))
+
+        for column, value in zip(self.columns, values):
+            column.append(value)
+
+    def append_none(self):
+        self.items.append(None)
+
+    def column(self, name):
+        return self.columns_by_name[name]
+
+    def row_count(self):
+        return len(self.columns[0])
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[item_index] for item_index in xrange(*index.indices(len(self.items)))]
+
+        item = self.items[index]
+
+        if type(item) is int:
+            item = self.items[index] = TROOPER_CODEC.record_from_values([column[item] for column in self.columns])
+
+        return item
+
+    def __iter__(self):
+        for index in xrange(len(self.items)):
+            yield self[index]
+
+    def __repr__(self):
+        return repr(list(self))
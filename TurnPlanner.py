@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from GrenadePlanner import grenade_planner_for
+from PassabilityGrid import passability_grid_for
+from WorldIndex import world_index_for
+
+from model.ActionType import ActionType
+from model.TrooperStance import TrooperStance
+
+
+class PlanningTimeout(Exception):
+    pass
+
+
+class TurnPlanner:
+    """
+    Планировщик хода бойца: перебор последовательностей действий (шаг, смена стойки, выстрел, граната, сухпаёк)
+    по модели из констант Game, пока хватает очков действия
+
+    Состояние - (x, y, стойка, очки действия, хиты врагов, есть граната, есть сухпаёк), враги стоят на месте.
+    Поиск в глубину с итеративным углублением и таблицей транспозиций; по истечении time_budget секунд
+    или после node_limit узлов (если задан) текущая итерация прерывается и отдаётся лучший найденный план.
+    Предел по узлам, в отличие от времени, даёт один и тот же план при каждом прогоне.
+    Оценка плана: нанесённый урон и очки за убитых минус урон, под который встаёт боец в конце хода
+    (один выстрел каждого живого врага, который его достаёт), с коэффициентом exposure_factor.
+
+    """
+
+    MAX_DEPTH = 24
+    NODES_PER_TIME_CHECK = 16
+
+    def __init__(self, me, world, game, time_budget, exposure_factor=1.0, node_limit=None):
+        self.me = me
+        self.world = world
+        self.game = game
+        self.time_budget = time_budget
+        self.node_limit = node_limit
+        self.exposure_factor = exposure_factor
+
+        self.grid = passability_grid_for(world)
+        self.passable = bytearray(self.grid.overlay_for(world))
+        self.passable[self.grid.index(me.x, me.y)] = 1
+
+        index = world_index_for(world)
+        self.enemies = index.enemies
+        self.teammate_cells = set((t.x, t.y) for t in index.teammates)
+
+        # клетки для гранаты - те же, что оценивает GrenadePlanner (враги и соседние с ними клетки)
+        self.grenade_planner = grenade_planner_for(world, game)
+        self.grenade_targets = [(x, y) for damage, order, x, y in self.grenade_planner.targets]
+
+        self.move_costs = {
+            TrooperStance.PRONE: game.prone_move_cost,
+            TrooperStance.KNEELING: game.kneeling_move_cost,
+            TrooperStance.STANDING: game.standing_move_cost,
+        }
+
+        self.visibilities = {}
+        self.throws = {}
+        self.exposures = {}
+        self.transpositions = {}
+
+        self.deadline = None
+        self.node_count = 0
+        self.completed_depth = 0
+
+        self.value = None
+        self.damage = 0
+        self.steps = []
+
+    def plan(self):
+        """
+        Лучший план в виде списка шагов (action, x, y); пустой список - лучше ничего не делать
+
+        """
+
+        self.deadline = time.time() + self.time_budget
+
+        state = (self.me.x, self.me.y, self.me.stance, self.me.action_points,
+                 tuple(e.hitpoints for e in self.enemies), self.me.holding_grenade, self.me.holding_field_ration)
+        self.value = self.evaluate(state)
+
+        for depth in xrange(1, TurnPlanner.MAX_DEPTH + 1):
+            try:
+                value, steps, leaf, cutoff = self.search(state, depth)
+            except PlanningTimeout:
+                break
+
+            self.completed_depth = depth
+            if value > self.value:
+                self.value = value
+                self.steps = steps
+                self.damage = sum(e.hitpoints - max(hitpoints, 0) for e, hitpoints in zip(self.enemies, leaf[4]))
+
+            # ни одна ветка не упёрлась в глубину - дальше искать нечего
+            if not cutoff:
+                break
+
+        return self.steps
+
+    def search(self, state, depth):
+        entry = self.transpositions.get(state)
+        if entry is not None and entry[0] >= depth:
+            return entry[1:]
+
+        self.node_count += 1
+        if self.node_limit is not None and self.node_count > self.node_limit:
+            raise PlanningTimeout()
+        if self.node_count % TurnPlanner.NODES_PER_TIME_CHECK == 0 and time.time() > self.deadline:
+            raise PlanningTimeout()
+
+        best_value, best_steps, best_leaf = self.evaluate(state), [], state
+        actions = self.actions(state)
+        cutoff = bool(actions) and depth == 0
+
+        if not cutoff:
+            for step, next_state in actions:
+                value, steps, leaf, next_cutoff = self.search(next_state, depth - 1)
+                cutoff = cutoff or next_cutoff
+
+                if value > best_value:
+                    best_value, best_steps, best_leaf = value, [step] + steps, leaf
+
+        best = (best_value, best_steps, best_leaf, cutoff)
+        self.transpositions[state] = (depth,) + best
+        return best
+
+    def actions(self, state):
+        x, y, stance, action_points, hitpoints, holding_grenade, holding_field_ration = state
+        me = self.me
+        game = self.game
+        out = []
+
+        if holding_field_ration and action_points >= game.field_ration_eat_cost:
+            next_action_points = action_points - game.field_ration_eat_cost + game.field_ration_bonus_action_points
+            out.append(((ActionType.EAT_FIELD_RATION, -1, -1),
+                        (x, y, stance, next_action_points, hitpoints, holding_grenade, False)))
+
+        if action_points >= me.shoot_cost:
+            damage = me.get_damage(stance)
+            for enemy_index, enemy in enumerate(self.enemies):
+                if hitpoints[enemy_index] > 0 and self.can_hit(me.shooting_range, x, y, stance, enemy_index):
+                    next_hitpoints = list(hitpoints)
+                    next_hitpoints[enemy_index] -= damage
+                    out.append(((ActionType.SHOOT, enemy.x, enemy.y),
+                                (x, y, stance, action_points - me.shoot_cost, tuple(next_hitpoints),
+                                 holding_grenade, holding_field_ration)))
+
+        if holding_grenade and action_points >= game.grenade_throw_cost:
+            for target_x, target_y in self.grenade_targets:
+                if self.can_throw(x, y, stance, target_x, target_y):
+                    next_hitpoints = self.grenade_hitpoints(x, y, target_x, target_y, hitpoints)
+                    if next_hitpoints is not None:
+                        out.append(((ActionType.THROW_GRENADE, target_x, target_y),
+                                    (x, y, stance, action_points - game.grenade_throw_cost, next_hitpoints,
+                                     False, holding_field_ration)))
+
+        if action_points >= game.stance_change_cost:
+            if stance < TrooperStance.STANDING:
+                out.append(((ActionType.RAISE_STANCE, -1, -1),
+                            (x, y, stance + 1, action_points - game.stance_change_cost, hitpoints,
+                             holding_grenade, holding_field_ration)))
+            if stance > TrooperStance.PRONE:
+                out.append(((ActionType.LOWER_STANCE, -1, -1),
+                            (x, y, stance - 1, action_points - game.stance_change_cost, hitpoints,
+                             holding_grenade, holding_field_ration)))
+
+        move_cost = self.move_costs[stance]
+        if action_points >= move_cost:
+            for i in self.grid.neighbours[self.grid.index(x, y)]:
+                if self.passable[i]:
+                    next_x, next_y = self.grid.coord(i)
+                    out.append(((ActionType.MOVE, next_x, next_y),
+                                (next_x, next_y, stance, action_points - move_cost, hitpoints,
+                                 holding_grenade, holding_field_ration)))
+
+        return out
+
+    def can_hit(self, max_range, x, y, stance, enemy_index):
+        key = (max_range, x, y, stance, enemy_index)
+        visible = self.visibilities.get(key)
+
+        if visible is None:
+            enemy = self.enemies[enemy_index]
+            visible = self.visibilities[key] = self.world.is_visible(max_range, x, y, stance,
+                                                                     enemy.x, enemy.y, enemy.stance)
+
+        return visible
+
+    def can_throw(self, x, y, stance, target_x, target_y):
+        key = (x, y, stance, target_x, target_y)
+        visible = self.throws.get(key)
+
+        if visible is None:
+            # как в GrenadePlanner.best_target: клетка видна из (x, y) в радиусе броска
+            visible = self.throws[key] = self.world.is_visible(self.game.grenade_throw_range, x, y, stance,
+                                                               target_x, target_y, TrooperStance.STANDING)
+
+        return visible
+
+    def grenade_hitpoints(self, x, y, target_x, target_y, hitpoints):
+        """
+        Хиты врагов после броска гранаты в клетку (target_x, target_y); None - если заденем своих
+        (в том числе себя на (x, y)) или никого из живых врагов
+
+        """
+
+        damage_cells = set(self.grenade_planner.damage_cells(target_x, target_y))
+        if (x, y) in damage_cells or (self.teammate_cells - set([(self.me.x, self.me.y)])) & damage_cells:
+            return None
+
+        next_hitpoints = list(hitpoints)
+        for enemy_index, enemy in enumerate(self.enemies):
+            if hitpoints[enemy_index] <= 0:
+                continue
+            if (enemy.x, enemy.y) == (target_x, target_y):
+                next_hitpoints[enemy_index] -= self.game.grenade_direct_damage
+            elif (enemy.x, enemy.y) in damage_cells:
+                next_hitpoints[enemy_index] -= self.game.grenade_collateral_damage
+
+        next_hitpoints = tuple(next_hitpoints)
+        return next_hitpoints if next_hitpoints != hitpoints else None
+
+    def evaluate(self, state):
+        x, y, stance, action_points, hitpoints = state[:5]
+
+        damage = 0
+        kill_count = 0
+        for enemy, enemy_hitpoints in zip(self.enemies, hitpoints):
+            damage += enemy.hitpoints - max(enemy_hitpoints, 0)
+            if enemy_hitpoints <= 0:
+                kill_count += 1
+
+        alive = tuple(enemy_hitpoints > 0 for enemy_hitpoints in hitpoints)
+        key = (x, y, stance, alive)
+        exposure = self.exposures.get(key)
+
+        if exposure is None:
+            exposure = self.exposures[key] = sum(
+                enemy.get_damage(enemy.stance) for enemy, enemy_alive in zip(self.enemies, alive)
+                if enemy_alive and self.world.is_visible(enemy.shooting_range, enemy.x, enemy.y, enemy.stance,
+                                                         x, y, stance)
+            )
+
+        return damage + kill_count * self.game.trooper_elimination_score - self.exposure_factor * exposure
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import itertools
+import json
+import os
+from math import hypot
+
+from DistanceField import distance_fields_for
+from PassabilityGrid import passability_grid_for
+
+
+class WaypointPlanner:
+    """
+    Вейпоинты отряда: свободные клетки у углов карты в порядке обхода и центр карты в конце
+
+    Клетку у угла выбираем среди достижимых от отряда, ближайшую к углу (при равенстве - ближе по пути).
+    Порядок углов - кратчайший по длине путей обход из точки отряда (перебор всех перестановок, углов всего четыре).
+    Длины путей берём из общих полей расстояний: к вейпоинтам потом всё равно будем ходить.
+    На диск по хешу одной карты сохраняются клетки у углов и центра с полями расстояний до них, порядок углов
+    считается из точки отряда уже после загрузки: в следующих играх на той же карте первый ход обходится
+    без поиска путей, с какого бы угла ни начинал отряд.
+
+    """
+
+    def __init__(self, world, cache_dir=None):
+        self.world = world
+        self.cache_dir = cache_dir
+
+    def plan(self, source):
+        cache_path = None
+        anchors = None
+
+        if self.cache_dir is not None:
+            cache_path = os.path.join(self.cache_dir, "%s.waypoints" % hashlib.md5(
+                repr((self.world.width, self.world.height, self.world.cells))
+            ).hexdigest())
+            anchors = self.load(cache_path)
+
+        if anchors is None:
+            anchors = self.anchors()
+            if cache_path is not None:
+                self.save(cache_path, anchors)
+
+        waypoints = self.order(source, anchors)
+        if waypoints is None:
+            # до какой-то из клеток у углов и центра от отряда не дойти - выбираем среди достижимых
+            waypoints = self.compute(source)
+
+        return waypoints
+
+    def anchor_coords(self):
+        width = self.world.width
+        height = self.world.height
+
+        return [(0, 0), (0, height - 1), (width - 1, height - 1), (width - 1, 0), (int(width / 2), int(height / 2))]
+
+    def anchors(self):
+        """
+        Данные карты без точки отряда: для каждого угла и центра - ближайшие к ним свободные клетки
+        (все на одном расстоянии) и поля расстояний до каждой из них
+
+        """
+
+        grid = passability_grid_for(self.world)
+        fields = distance_fields_for(self.world)
+        free = [grid.coord(i) for i in xrange(grid.cell_count) if grid.passable[i]]
+
+        anchors = []
+        for anchor in self.anchor_coords():
+            if not free:
+                anchors.append([])
+                continue
+
+            ranges = [hypot(coord[0] - anchor[0], coord[1] - anchor[1]) for coord in free]
+            nearest = min(ranges)
+            anchors.append([(coord, list(fields.field(grid.index(*coord)).distances))
+                            for coord, distance in zip(free, ranges) if distance == nearest])
+
+        return anchors
+
+    def order(self, source, anchors):
+        """
+        Вейпоинты из данных карты для точки отряда: у каждого угла и центра - ближайшая по пути клетка,
+        углы - в порядке кратчайшего обхода. None - если до какой-то из клеток от source не дойти
+
+        """
+
+        grid = passability_grid_for(self.world)
+        source_index = grid.index(*source)
+
+        chosen = []
+        for candidates in anchors:
+            reachable = [(distances[source_index], coord, distances) for coord, distances in candidates
+                         if distances[source_index] >= 0]
+            if not reachable:
+                return None
+            chosen.append(min(reachable, key=lambda item: item[0])[1:])
+
+        corners = [coord for coord, distances in chosen[:4]]
+        corner_fields = dict(chosen[:4])
+
+        def path_length(coord_from, coord_to):
+            return corner_fields[coord_to][grid.index(*coord_from)]
+
+        def route_length(order):
+            return sum(path_length(coord_from, coord_to) for coord_from, coord_to in zip((source,) + order, order))
+
+        return list(min(itertools.permutations(corners), key=route_length)) + [chosen[4][0]]
+
+    def compute(self, source):
+        grid = passability_grid_for(self.world)
+        fields = distance_fields_for(self.world)
+
+        source_field = fields.field(grid.index(*source))
+        reachable = [(grid.coord(i), source_field.distance(i)) for i in xrange(grid.cell_count)
+                     if source_field.distance(i) >= 0] or [(source, 0)]
+
+        def near(anchor):
+            return min(reachable, key=lambda item: (
+                hypot(item[0][0] - anchor[0], item[0][1] - anchor[1]), item[1]
+            ))[0]
+
+        anchors = [near(anchor) for anchor in self.anchor_coords()]
+        corners, center = anchors[:4], anchors[4]
+
+        def path_length(coord_from, coord_to):
+            return fields.field(grid.index(*coord_to)).distance(grid.index(*coord_from))
+
+        def route_length(order):
+            return sum(path_length(coord_from, coord_to) for coord_from, coord_to in zip((source,) + order, order))
+
+        return list(min(itertools.permutations(corners), key=route_length)) + [center]
+
+    @staticmethod
+    def load(path):
+        try:
+            with open(path, "rb") as anchors_file:
+                anchors = json.load(anchors_file)["anchors"]
+            return [[(tuple(coord), distances) for coord, distances in candidates] for candidates in anchors]
+        except (IOError, ValueError, KeyError, TypeError):
+            return None
+
+    @staticmethod
+    def save(path, anchors):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp_path, "wb") as anchors_file:
+            json.dump(dict(anchors=anchors), anchors_file)
+        os.rename(temp_path, path)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+from math import hypot
+
+
+class WorldIndex:
+    """
+    Индекс снимка мира: свои/чужие бойцы, центр и средняя дальность стрельбы отряда,
+    расстояния между бойцами отряда. Строится один раз на объект World при первом обращении.
+
+    """
+
+    def __init__(self, world):
+        self.teammates = [t for t in world.troopers if t.teammate]
+        self.teammates_by_id = dict((t.id, t) for t in self.teammates)
+        self.enemies = [t for t in world.troopers if not t.teammate]
+
+        if self.teammates:
+            current_x = [t.x for t in self.teammates]
+            current_y = [t.y for t in self.teammates]
+            self.team_coord = int(sum(current_x) / len(current_x)), int(sum(current_y) / len(current_y))
+
+            ranges = [t.shooting_range for t in self.teammates]
+            self.team_avg_shooting_range = sum(ranges) / len(ranges)
+        else:
+            self.team_coord = None
+            self.team_avg_shooting_range = None
+
+        # попарные расстояния между бойцами отряда
+        self.team_distances = dict(((a.id, b.id), hypot(b.x - a.x, b.y - a.y))
+                                   for a in self.teammates for b in self.teammates)
+        self.max_team_distances = {}
+
+    def max_distance_to_team(self, unit):
+        """
+        Наибольшее расстояние от юнита (бойца или бонуса) до бойцов отряда, кроме юнита с тем же id
+        None, если кроме него в отряде никого нет
+
+        """
+
+        key = (unit.id, unit.x, unit.y)
+        if key in self.max_team_distances:
+            return self.max_team_distances[key]
+
+        teammate = self.teammates_by_id.get(unit.id)
+        if teammate is not None and (teammate.x, teammate.y) == (unit.x, unit.y):
+            ranges = [self.team_distances[(unit.id, t.id)] for t in self.teammates if t.id != unit.id]
+        else:
+            ranges = [unit.get_distance_to(t.x, t.y) for t in self.teammates if t.id != unit.id]
+
+        distance = max(ranges) if ranges else None
+        self.max_team_distances[key] = distance
+        return distance
+
+
+def world_index_for(world):
+    index = getattr(world, "world_index", None)
+
+    if index is None:
+        index = world.world_index = WorldIndex(world)
+
+    return index
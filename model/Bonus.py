@@ -2,6 +2,8 @@ from Unit import Unit
 
 
 class Bonus(Unit):
+    __slots__ = ("type",)
+
     def __init__(self, id, x, y, type):
         Unit.__init__(self, id, x, y)
 
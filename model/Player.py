@@ -1,4 +1,6 @@
-class Player:
+class Player(object):
+    __slots__ = ("id", "name", "score", "strategy_crashed", "approximate_x", "approximate_y")
+
     def __init__(self, id, name, score, strategy_crashed, approximate_x, approximate_y):
         self.id = id
         self.name = name
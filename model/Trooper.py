@@ -3,6 +3,12 @@ from model.TrooperStance import TrooperStance
 
 
 class Trooper(Unit):
+    __slots__ = ("player_id", "teammate_index", "teammate", "type", "stance",
+                 "hitpoints", "maximal_hitpoints", "action_points", "initial_action_points",
+                 "vision_range", "shooting_range", "shoot_cost",
+                 "standing_damage", "kneeling_damage", "prone_damage", "damage",
+                 "holding_grenade", "holding_medikit", "holding_field_ration")
+
     def __init__(self, id, x, y, player_id,
                  teammate_index, teammate, type, stance,
                  hitpoints, maximal_hitpoints, action_points, initial_action_points,
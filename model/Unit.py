@@ -1,7 +1,9 @@
 from math import *
 
 
-class Unit:
+class Unit(object):
+    __slots__ = ("id", "x", "y")
+
     def __init__(self, id, x, y):
         self.id = id
         self.x = x
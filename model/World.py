@@ -1,6 +1,12 @@
+import binascii
 from math import *
 from TrooperStance import TrooperStance
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class World:
     def __init__(self, move_index, width, height, players, troopers, bonuses, cells, cell_visibilities):
@@ -19,9 +25,18 @@ class World:
             if not str(enum_key).startswith("__"):
                 self.stance_count += 1
 
+        self._visibility_tensor = None
+
+        # CompactVisibility store instead of raw bytes answers visibility queries itself
+        self._compact_visibility = cell_visibilities if hasattr(cell_visibilities, "visible_cells_bits") else None
+
     def is_visible(self, max_range,
                    viewer_x, viewer_y, viewer_stance,
                    object_x, object_y, object_stance):
+        if self._compact_visibility is not None:
+            return self._compact_visibility.is_visible(max_range, viewer_x, viewer_y, viewer_stance,
+                                                       object_x, object_y, object_stance)
+
         min_stance_index = min(viewer_stance, object_stance)
         x_range = object_x - viewer_x
         y_range = object_y - viewer_y
@@ -32,4 +47,81 @@ class World:
             + object_x * self.height * self.stance_count
             + object_y * self.stance_count
             + min_stance_index
-        ]) == 1
\ No newline at end of file
+        ]) == 1
+
+    @property
+    def visibility_tensor(self):
+        # (viewer_x, viewer_y, object_x, object_y, stance) view over received bytes, None without numpy
+        if numpy is None or self._compact_visibility is not None:
+            return None
+
+        if self._visibility_tensor is None:
+            self._visibility_tensor = numpy.frombuffer(self.cell_visibilities, dtype=numpy.uint8).reshape(
+                (self.width, self.height, self.width, self.height, self.stance_count)
+            )
+
+        return self._visibility_tensor
+
+    def visible_cells(self, max_range, viewer_x, viewer_y, viewer_stance, object_stance=TrooperStance.STANDING):
+        # boolean mask [x][y] of cells visible from viewer (numpy array or list of lists without numpy)
+        min_stance_index = min(viewer_stance, object_stance)
+        max_range_square = max_range * max_range
+
+        if self._compact_visibility is not None:
+            bits = self._compact_visibility.visible_cells_bits(max_range, viewer_x, viewer_y, viewer_stance,
+                                                               object_stance)
+            cell_count = self.width * self.height
+
+            if numpy is not None:
+                # big-endian bytes of the bitset unpacked MSB first, reversed: element i is bit i (cell x * height + y)
+                raw = binascii.unhexlify("%0*x" % ((cell_count + 7) / 8 * 2, bits))
+                unpacked = numpy.unpackbits(numpy.frombuffer(raw, dtype=numpy.uint8))[::-1]
+                return unpacked[:cell_count].reshape((self.width, self.height)).astype(bool)
+
+            return [[(bits >> (x * self.height + y)) & 1 == 1 for y in xrange(self.height)]
+                    for x in xrange(self.width)]
+
+        if numpy is not None:
+            x_ranges = numpy.arange(self.width)[:, None] - viewer_x
+            y_ranges = numpy.arange(self.height)[None, :] - viewer_y
+
+            return (self.visibility_tensor[viewer_x, viewer_y, :, :, min_stance_index] == 1) & \
+                   (x_ranges * x_ranges + y_ranges * y_ranges <= max_range_square)
+
+        row_size = self.width * self.height * self.stance_count
+        row_offset = (viewer_x * self.height + viewer_y) * row_size
+        row = bytearray(self.cell_visibilities[row_offset:row_offset + row_size])[min_stance_index::self.stance_count]
+
+        return [[row[x * self.height + y] == 1 and
+                 (x - viewer_x) * (x - viewer_x) + (y - viewer_y) * (y - viewer_y) <= max_range_square
+                 for y in xrange(self.height)] for x in xrange(self.width)]
+
+    def are_visible(self, max_range,
+                    viewer_xs, viewer_ys, viewer_stances,
+                    object_xs, object_ys, object_stances):
+        """
+        Visibility of many (viewer, object) pairs at once; max_range is a number or a sequence per pair.
+
+        Returns a flat sequence with one boolean per pair, in pair order: a numpy bool array of shape
+        (pair_count,) with numpy over the raw byte store, otherwise a plain list of pair_count bools.
+        Unlike visible_cells, the fallback is never nested.
+        """
+
+        if numpy is not None and self._compact_visibility is None:
+            viewer_xs = numpy.asarray(viewer_xs)
+            viewer_ys = numpy.asarray(viewer_ys)
+            object_xs = numpy.asarray(object_xs)
+            object_ys = numpy.asarray(object_ys)
+            max_ranges = numpy.asarray(max_range)
+            x_ranges = object_xs - viewer_xs
+            y_ranges = object_ys - viewer_ys
+
+            return (self.visibility_tensor[viewer_xs, viewer_ys, object_xs, object_ys,
+                                           numpy.minimum(viewer_stances, object_stances)] == 1) & \
+                   (x_ranges * x_ranges + y_ranges * y_ranges <= max_ranges * max_ranges)
+
+        pair_count = len(viewer_xs)
+        max_ranges = max_range if hasattr(max_range, "__len__") else [max_range] * pair_count
+
+        return [self.is_visible(max_ranges[i], viewer_xs[i], viewer_ys[i], viewer_stances[i],
+                                object_xs[i], object_ys[i], object_stances[i]) for i in xrange(pair_count)]